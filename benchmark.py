@@ -0,0 +1,637 @@
+import argparse
+import contextlib
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+import network_simulator as ns
+import network_simulator.acl as acl
+import network_simulator.events as ev
+import network_simulator.graph as g
+import network_simulator.loader as ld
+import network_simulator.packet as p
+import network_simulator.routing as rt
+import network_simulator.topology as tp
+
+
+# average wall time of fn over the given number of runs
+def timeit(fn, runs=3) -> float:
+    start = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    return (time.perf_counter() - start) / runs
+
+
+def bench_dijkstra():
+    print("dijkstra: single-source run time against V and E")
+    print("%8s %8s %12s" % ("V", "E", "ms/run"))
+    for n in (1000, 5000, 20000, 100000):
+        for degree in (2, 8):
+            graph = g.Graph(tp.random_graph(n, n * degree // 2))
+            graph.get_csr()
+            t = timeit(lambda: graph.dijkstra(0))
+            print("%8d %8d %12.2f" % (n, n * degree // 2, t * 1000))
+
+
+def bench_build():
+    print("Simulator: construction time with shared routing engine")
+    print("%8s %8s %12s" % ("V", "E", "s/build"))
+    for n in (500, 1000, 2000):
+        graph_config = tp.random_graph(n, n * 2)
+        ibgp_config = tp.plain_config(graph_config)
+        t = timeit(lambda: ns.Simulator(graph_config, ibgp_config), runs=1)
+        print("%8d %8d %12.2f" % (n, n * 2, t))
+
+
+def bench_link_updates():
+    print("Simulator: single link changes with incremental repair")
+    print("%8s %8s %12s" % ("V", "E", "ms/update"))
+    for n in (500, 1000, 2000):
+        graph_config = tp.random_graph(n, n * 2)
+        ibgp_config = tp.plain_config(graph_config)
+        s = ns.Simulator(graph_config, ibgp_config)
+        rng = random.Random(1)
+        links = [(a, b) for a in graph_config for b in graph_config[a] if a < b]
+        updates = [rng.choice(links) + (rng.randint(1, 10),) for _ in range(100)]
+        start = time.perf_counter()
+        for l1, l2, cost in updates:
+            s.update_link_cost(l1, l2, cost)
+        t = (time.perf_counter() - start) / len(updates)
+        print("%8d %8d %12.2f" % (n, n * 2, t * 1000))
+
+
+def bench_batch_updates():
+    print("Simulator: 200-link maintenance window, one update at a time vs batched")
+    print("%8s %8s %12s %12s" % ("V", "E", "s/single", "s/batch"))
+    for n in (500, 1000):
+        graph_config = tp.random_graph(n, n * 2)
+        rng = random.Random(2)
+        links = [(a, b) for a in graph_config for b in graph_config[a] if a < b]
+        updates = [rng.choice(links) + (rng.randint(1, 10),) for _ in range(200)]
+        times = []
+        for batched in (False, True):
+            config = {i: dict(nbs) for i, nbs in graph_config.items()}
+            s = ns.Simulator(config, tp.plain_config(config))
+            start = time.perf_counter()
+            if batched:
+                s.apply_link_updates(updates)
+            else:
+                for l1, l2, cost in updates:
+                    s.update_link_cost(l1, l2, cost)
+            times.append(time.perf_counter() - start)
+        print("%8d %8d %12.2f %12.2f" % (n, n * 2, times[0], times[1]))
+
+
+# install a rule allowing every (src, dst) pair on every router
+def allow_all(s, nodes) -> None:
+    for i in nodes:
+        s.add_acl(i, True, acl.ANY, acl.ANY)
+
+
+def bench_route_flows():
+    print("Simulator: bulk forwarding of random flows")
+    print("%8s %10s %12s %12s" % ("V", "flows", "s/matrix", "s/forward"))
+    for n in (100, 500):
+        graph_config = tp.random_graph(n, n * 2)
+        s = ns.Simulator(graph_config, tp.plain_config(graph_config))
+        allow_all(s, list(graph_config))
+        rng = random.Random(3)
+        flows = 200000
+        senders = [rng.randrange(n) for _ in range(flows)]
+        receivers = [rng.randrange(n) for _ in range(flows)]
+        start = time.perf_counter()
+        matrix = s.build_next_hop_matrix()
+        t_matrix = time.perf_counter() - start
+        t_forward = timeit(lambda: s.route_flows(senders, receivers, matrix=matrix), runs=1)
+        print("%8d %10d %12.2f %12.2f" % (n, flows, t_matrix, t_forward))
+
+
+def bench_acl():
+    import network_simulator.router as r
+    print("ACL: rule installs and checks on one router")
+    print("%10s %12s %12s" % ("rules", "us/install", "us/check"))
+    for side in (100, 316, 1000):
+        router = r.Router(0, {0: {}})
+        pairs = [(a, b) for a in range(side) for b in range(side)]
+        start = time.perf_counter()
+        for a, b in pairs:
+            router.add_acl(True, a, b)
+        t_install = (time.perf_counter() - start) / len(pairs)
+        start = time.perf_counter()
+        for a, b in pairs:
+            router.check_acl(a, b)
+        t_check = (time.perf_counter() - start) / len(pairs)
+        print("%10d %12.2f %12.2f" % (len(pairs), t_install * 1e6, t_check * 1e6))
+    # the ID space grows with the rule count so a router is covered by about
+    # the same number of ranges at every size
+    print("ACL: checks against random range and wildcard rules")
+    print("%10s %12s" % ("rules", "us/check"))
+    rng = random.Random(4)
+    for count in (1000, 10000, 100000):
+        router = r.Router(0, {0: {}})
+        space = count * 10
+        for _ in range(count):
+            lo = rng.randrange(space)
+            src = range(lo, lo + rng.randint(1, 100))
+            dst = acl.ANY if rng.random() < 0.5 else rng.randrange(space)
+            router.add_acl(rng.random() < 0.5, src, dst)
+        probes = [(rng.randrange(space), rng.randrange(space)) for _ in range(10000)]
+        router.check_acl(0, 0)
+        t = timeit(lambda: [router.check_acl(a, b) for a, b in probes], runs=1) / len(probes)
+        print("%10d %12.2f" % (count, t * 1e6))
+    print("ACL: positional installs and removals next to existing rules")
+    print("%10s %12s %12s %12s %12s" % ("rules", "us/append", "us/front", "us/middle", "us/remove"))
+    for count in (10000, 100000):
+        router = r.Router(0, {0: {}})
+        for i in range(count):
+            router.add_acl(True, i, 0)
+        t_append = timeit(lambda: [router.add_acl(True, count + i, 1) for i in range(1000)], runs=1) / 1000
+        t_front = timeit(lambda: [router.add_acl(True, i, 2, 0) for i in range(1000)], runs=1) / 1000
+        t_middle = timeit(lambda: [router.add_acl(True, i, 3, len(router.access_list) // 2)
+                                   for i in range(1000)], runs=1) / 1000
+        order = list(range(count))
+        rng.shuffle(order)
+        t_remove = timeit(lambda: [router.remove_acl(True, i, 0) for i in order[:1000]], runs=1) / 1000
+        print("%10d %12.2f %12.2f %12.2f %12.2f" % (len(router.access_list), t_append * 1e6,
+                                                    t_front * 1e6, t_middle * 1e6, t_remove * 1e6))
+
+
+def bench_reachability():
+    print("Simulator: check_node_reachability on random pairs")
+    print("%8s %8s %12s" % ("V", "E", "us/check"))
+    for n in (100, 1000):
+        graph_config = tp.random_graph(n, n * 2)
+        s = ns.Simulator(graph_config, tp.plain_config(graph_config))
+        allow_all(s, list(graph_config))
+        rng = random.Random(5)
+        pairs = [(rng.randrange(n), rng.randrange(n)) for _ in range(10000)]
+        t = timeit(lambda: [s.check_node_reachability(a, b) for a, b in pairs], runs=1)
+        print("%8d %8d %12.2f" % (n, n * 2, t / len(pairs) * 1e6))
+
+
+def bench_verify_all():
+    print("Simulator: all-pairs verification")
+    print("%8s %8s %14s %14s" % ("V", "E", "s/allow-all", "s/per-source"))
+    for n in (300, 1000):
+        graph_config = tp.random_graph(n, n * 2)
+        s = ns.Simulator(graph_config, tp.plain_config(graph_config))
+        allow_all(s, list(graph_config))
+        t_uniform = timeit(s.verify_all, runs=1)
+        # a source-specific rule on every router defeats the memoized tails
+        for i in graph_config:
+            s.add_acl(i, False, n, acl.ANY, pos=0)
+        t_specific = timeit(s.verify_all, runs=1)
+        print("%8d %8d %14.2f %14.2f" % (n, n * 2, t_uniform, t_specific))
+
+
+def bench_next_hop():
+    import network_simulator.router as r
+    print("Router: per-hop table lookup, copying the table vs reading it in place")
+    print("%10s %12s %12s" % ("entries", "us/copy", "us/lookup"))
+    for n in (100, 1000, 10000):
+        router = r.Router(0, tp.random_graph(n, n * 2))
+        dsts = list(router.routing_table)[:1000]
+        t_copy = timeit(lambda: [router.get_routing_table()[d] for d in dsts], runs=1) / len(dsts)
+        t_lookup = timeit(lambda: [router.get_next_hop(d) for d in dsts], runs=1) / len(dsts)
+        print("%10d %12.2f %12.2f" % (n, t_copy * 1e6, t_lookup * 1e6))
+
+
+def bench_insert_eBGP():
+    print("BGP: inserting external prefixes one by one vs as one table")
+    print("%8s %10s %12s %12s" % ("V", "prefixes", "s/single", "s/table"))
+    for n, count in ((50, 2000), (50, 20000)):
+        times = []
+        for bulk in (False, True):
+            graph_config = tp.random_graph(n, n * 2)
+            ibgp_config = tp.reflector_config(graph_config)
+            s = ns.Simulator(graph_config, ibgp_config)
+            for router in s.routers.values():
+                router.start_iBGP_session(ibgp_config)
+            prefixes = list(range(n, n + count))
+            start = time.perf_counter()
+            if bulk:
+                s.insert_eBGP_table(prefixes, 0)
+            elif count <= 2000:
+                for prefix in prefixes:
+                    s.insert_eBGP(prefix, 0)
+            times.append(time.perf_counter() - start if bulk or count <= 2000 else float("nan"))
+        print("%8d %10d %12.2f %12.2f" % (n, count, times[0], times[1]))
+
+def bench_delete_iBGP():
+    print("BGP: tearing down a session carrying 100 prefixes next to a large table")
+    print("%8s %10s %12s" % ("V", "prefixes", "s/delete"))
+    for n, count in ((50, 1000), (50, 10000), (50, 40000)):
+        graph_config = tp.random_graph(n, n * 2)
+        ibgp_config = tp.reflector_config(graph_config)
+        s = ns.Simulator(graph_config, ibgp_config)
+        for router in s.routers.values():
+            router.start_iBGP_session(ibgp_config)
+        s.insert_eBGP_table(range(n, n + count), 1)
+        s.insert_eBGP_table(range(n + count, n + count + 100), 0)
+        rr = ibgp_config[0]['client'][0]
+        start = time.perf_counter()
+        s.delete_iBGP(0, rr)
+        print("%8d %10d %12.4f" % (n, count, time.perf_counter() - start))
+
+def bench_hot_potato():
+    print("BGP: link updates with best paths re-chosen for affected prefixes only")
+    print("%8s %10s %12s %12s %10s" % ("V", "prefixes", "s/update", "s/full", "changed"))
+    for n, count in ((50, 2000), (50, 20000)):
+        graph_config = tp.random_graph(n, n * 2)
+        ibgp_config = tp.reflector_config(graph_config)
+        s = ns.Simulator(graph_config, ibgp_config)
+        for router in s.routers.values():
+            router.start_iBGP_session(ibgp_config)
+        s.insert_eBGP_table(range(n, n + count), 0)
+        s.insert_eBGP_table(range(n + count // 2, n + count + count // 2), 1)
+        rnd = random.Random(0)
+        links = [(a, b) for a in graph_config for b in graph_config[a] if a < b]
+        updates = [(a, b, rnd.randint(1, 10)) for a, b in rnd.sample(links, 20)]
+        changed = 0
+        start = time.perf_counter()
+        for a, b, cost in updates:
+            changed += sum(dst >= n for _, dst in s.update_link_cost(a, b, cost))
+        per_update = (time.perf_counter() - start) / len(updates)
+        # choosing every best path again, as needed without the gateway index
+        start = time.perf_counter()
+        for router in s.routers.values():
+            router.opt_iBGP_routes(list(router.rib.by_prefix))
+        full = time.perf_counter() - start
+        print("%8d %10d %12.4f %12.4f %10d" % (n, count, per_update, full, changed // len(updates)))
+
+def bench_events():
+    print("Events: scheduler throughput and timed packet forwarding")
+    noop = lambda: None
+    count = 1000000
+    rnd = random.Random(0)
+    # integer times share buckets, distinct float times each cost a heap entry
+    for label, when in (("integer times", lambda: rnd.randrange(1000)),
+                        ("float times", lambda: rnd.random() * 1000)):
+        times = [when() for _ in range(count)]
+        clock = ev.Scheduler()
+        start = time.perf_counter()
+        for t in times:
+            clock.at(t, noop)
+        clock.run()
+        elapsed = time.perf_counter() - start
+        print("%10d events, %-13s %8.2f s %12.0f events/s" % (count, label, elapsed, count / elapsed))
+    n = 500
+    s = ns.Simulator(tp.random_graph(n, n * 3), tp.plain_config(range(n)))
+    allow_all(s, range(n))
+    for i in range(n):
+        s.routers[i].routing_table
+    for i in range(20000):
+        s.schedule_packet(rnd.randrange(n), rnd.randrange(n), at=rnd.randrange(100))
+    start = time.perf_counter()
+    events = s.run_events()
+    elapsed = time.perf_counter() - start
+    print("%10d packet hops %18.2f s %12.0f events/s" % (events, elapsed, events / elapsed))
+
+# the packet class before it had slots, kept to compare memory use
+class DictPacket:
+    def __init__(self, sender, receiver):
+        self.sender = sender
+        self.receiver = receiver
+        self.status = False
+        self.TTL = p.DEFAULT_TTL
+        self.path = []
+        self.outcome = None
+
+    def stamp_packet(self, router):
+        self.path.append(router)
+
+
+def bench_packets():
+    print("Packets: memory of 100k live packets after 6 hops")
+    print("%-20s %12s" % ("packet", "bytes/packet"))
+    count = 100000
+    kinds = (("dict, full path", DictPacket),
+             ("slots, full path", lambda a, b: p.Packet(a, b)),
+             ("slots, ring of 4", lambda a, b: p.Packet(a, b, 4)),
+             ("slots, no path", lambda a, b: p.Packet(a, b, p.PATH_OFF)))
+    for label, make in kinds:
+        tracemalloc.start()
+        packets = [make(i, i + 1) for i in range(count)]
+        for packet in packets:
+            for hop in range(6):
+                packet.stamp_packet(hop)
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del packets
+        print("%-20s %12.0f" % (label, size / count))
+    print("Packets: sending 20k packets one by one vs from a pool")
+    n = 200
+    s = ns.Simulator(tp.random_graph(n, n * 3), tp.plain_config(range(n)))
+    allow_all(s, range(n))
+    rnd = random.Random(0)
+    senders = [rnd.randrange(n) for _ in range(20000)]
+    receivers = [rnd.randrange(n) for _ in range(20000)]
+    single = timeit(lambda: [s.send_packet(a, b) for a, b in zip(senders, receivers)], runs=1)
+    pooled = timeit(lambda: s.send_packets(senders, receivers), runs=1)
+    print("%12.2f s/single %12.2f s/pooled" % (single, pooled))
+
+def bench_parallel():
+    print("Routing: all trees computed by 1 to 32 processes, %d cores available" % os.cpu_count())
+    print("%8s %8s %10s %12s %10s" % ("V", "E", "workers", "s/compute", "speedup"))
+    n = 1000
+    graph = g.Graph(tp.random_graph(n, n * 3))
+    serial = None
+    for workers in (1, 2, 4, 8, 16, 32):
+        engine = rt.RoutingEngine(graph, workers)
+        t = timeit(engine.compute_all, runs=1)
+        engine.close()
+        serial = serial or t
+        print("%8d %8d %10d %12.2f %10.2f" % (n, n * 3, workers, t, serial / t))
+
+
+def bench_fork():
+    print("Simulator: branching what-if state, fork vs get_routers deepcopy")
+    print("%8s %10s %12s %12s %12s" % ("V", "prefixes", "ms/fork", "ms/what-if", "s/deepcopy"))
+    for n in (200, 1000):
+        graph_config = tp.random_graph(n, n * 2)
+        ibgp_config = tp.reflector_config(graph_config)
+        s = ns.Simulator(graph_config, ibgp_config)
+        for router in s.routers.values():
+            router.start_iBGP_session(ibgp_config)
+        s.insert_eBGP_table(range(n, n + 1000), 0)
+        allow_all(s, list(graph_config))
+        t_fork = timeit(s.fork, runs=20)
+        # fail one link in a fork and check one pair, then drop the fork
+        rng = random.Random(6)
+        links = [(a, b) for a in graph_config for b in graph_config[a] if a < b]
+        scenarios = rng.sample(links, 20)
+        start = time.perf_counter()
+        for a, b in scenarios:
+            f = s.fork()
+            f.update_link_cost(a, b, 0)
+            f.check_node_reachability(a, b)
+        t_what_if = (time.perf_counter() - start) / len(scenarios)
+        t_copy = timeit(s.get_routers, runs=1)
+        print("%8d %10d %12.2f %12.2f %12.2f" % (n, 1000, t_fork * 1000, t_what_if * 1000, t_copy))
+
+
+def bench_failures():
+    print("Failures: N-1 sweep, fail/verify/restore in place vs failure_sweep")
+    print("%8s %8s %12s %12s %12s" % ("V", "links", "s/in place", "s/sweep", "s/workers"))
+    workers = os.cpu_count() or 1
+    for n in (50, 100):
+        graph_config = tp.random_graph(n, n * 2)
+        s = ns.Simulator(graph_config, tp.plain_config(graph_config))
+        allow_all(s, list(graph_config))
+        links = [(a, b) for a in graph_config for b in graph_config[a] if a < b]
+        start = time.perf_counter()
+        for a, b in links:
+            cost = s.engine.graph.map[a][b]
+            s.update_link_cost(a, b, 0)
+            s.verify_all()
+            with s.link_updates() as batch:
+                batch.create_link(a, b, cost)
+        t_place = time.perf_counter() - start
+        s = ns.Simulator(graph_config, tp.plain_config(graph_config))
+        allow_all(s, list(graph_config))
+        t_sweep = timeit(s.failure_sweep, runs=1)
+        t_workers = timeit(lambda: s.failure_sweep(workers=workers), runs=1)
+        print("%8d %8d %12.2f %12.2f %12.2f" % (n, len(links), t_place, t_sweep, t_workers))
+
+
+def bench_ecmp():
+    print("ECMP: fat-tree flows, per-hop cost and busiest link, single path vs ECMP")
+    print("%6s %8s %10s %12s %12s %10s %10s" % ("k", "V", "flows", "us/hop", "us/hop ecmp", "max load", "max ecmp"))
+    for k in (8, 12):
+        graph_config = tp.fat_tree(k)
+        # traffic between the edge switches, which come second in every pod
+        edges = [i for i in graph_config if (i - k * k // 4) % k >= k // 2]
+        rng = random.Random(7)
+        count = 20000
+        senders = [rng.choice(edges) for _ in range(count)]
+        receivers = [rng.choice(edges) for _ in range(count)]
+        flows = [rng.randrange(1 << 16) for _ in range(count)]
+        row = []
+        for ecmp in (False, True):
+            s = ns.Simulator(graph_config, tp.plain_config(graph_config), ecmp=ecmp)
+            allow_all(s, list(graph_config))
+            # the first packets load the equal-cost sets
+            s.send_packets(senders, receivers, flows=flows)
+            start = time.perf_counter()
+            result = s.send_packets(senders, receivers, flows=flows)
+            t = time.perf_counter() - start
+            load = {}
+            for path in s.route_flows(senders, receivers, record_paths=True, flows=flows).paths:
+                for link in zip(path, path[1:]):
+                    load[link] = load.get(link, 0) + 1
+            row.append((t / (sum(result.hops) + count), max(load.values())))
+        print("%6d %8d %10d %12.2f %12.2f %10d %10d" % (k, len(graph_config), count, row[0][0] * 1e6,
+                                                        row[1][0] * 1e6, row[0][1], row[1][1]))
+
+
+def bench_traffic():
+    print("Traffic: link loads of a demand matrix, per-destination aggregation vs per-flow walks")
+    print("%8s %10s %12s %12s %12s %10s" % ("V", "demands", "s/walks", "s/matrix", "ms/update", "dsts"))
+    for n, count in ((500, 50000), (2000, 200000)):
+        graph_config = tp.random_graph(n, n * 2)
+        s = ns.Simulator(graph_config, tp.plain_config(graph_config))
+        allow_all(s, list(graph_config))
+        rng = random.Random(8)
+        demands = {}
+        for _ in range(count):
+            demands[(rng.randrange(n), rng.randrange(n))] = rng.randint(1, 100)
+        # sum the volume over the path of every demand
+        start = time.perf_counter()
+        loads = {}
+        for (a, b), volume in demands.items():
+            pk = p.Packet(a, b)
+            s.walk_packet(pk)
+            path = pk.get_path()
+            for link in zip(path, path[1:]):
+                loads[link] = loads.get(link, 0) + volume
+        t_walks = time.perf_counter() - start
+        start = time.perf_counter()
+        matrix = s.traffic_matrix(demands)
+        matrix.get_loads()
+        t_matrix = time.perf_counter() - start
+        links = [(a, b) for a in graph_config for b in graph_config[a] if a < b]
+        updates = [rng.choice(links) + (rng.randint(1, 10),) for _ in range(20)]
+        dsts = 0
+        start = time.perf_counter()
+        for l1, l2, cost in updates:
+            s.update_link_cost(l1, l2, cost)
+            dsts += len(matrix.dirty)
+            matrix.get_loads()
+        t_update = (time.perf_counter() - start) / len(updates)
+        print("%8d %10d %12.2f %12.2f %12.2f %10d" % (n, len(demands), t_walks, t_matrix,
+                                                      t_update * 1000, dsts // len(updates)))
+
+
+# wall time of fn, then the peak of the memory it allocates in a second run
+def time_and_peak(fn) -> tuple:
+    t = timeit(fn, runs=1)
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return t, peak
+
+
+# the links file read into a graph_config, the only way in before loader
+def read_config(path) -> dict:
+    graph_config = {}
+    for a, b, cost, _ in ld.read_links(path):
+        graph_config.setdefault(a, {})[b] = cost
+        graph_config.setdefault(b, {})[a] = cost
+    return graph_config
+
+
+def bench_load():
+    print("Loading: links file read into a graph_config vs streamed into the CSR")
+    print("%8s %8s %6s %12s %12s %12s %12s" % ("V", "E", "file", "s/config", "s/stream",
+                                               "MB/config", "MB/stream"))
+    with tempfile.TemporaryDirectory() as tmp:
+        for n, m in ((20000, 100000), (50000, 400000)):
+            graph_config = tp.random_graph(n, m)
+            for ext in ('csv', 'jsonl'):
+                path = os.path.join(tmp, 'links.' + ext)
+                ld.write_links(path, graph_config)
+                t_config, peak_config = time_and_peak(lambda: g.Graph(read_config(path)).get_csr())
+                t_stream, peak_stream = time_and_peak(lambda: ld.load_graph(path))
+                print("%8d %8d %6s %12.2f %12.2f %12.1f %12.1f" % (
+                    n, m, ext, t_config, t_stream, peak_config / 2 ** 20, peak_stream / 2 ** 20))
+        print("Loading: whole simulator from a links and a sessions file")
+        print("%8s %8s %12s %12s %12s %12s" % ("V", "E", "s/config", "s/stream", "MB/config", "MB/stream"))
+        for n in (500, 1000):
+            graph_config = tp.random_graph(n, n * 4)
+            ibgp_config = tp.reflector_config(graph_config)
+            links, sessions = os.path.join(tmp, 'links.csv'), os.path.join(tmp, 'sessions.csv')
+            ld.write_links(links, graph_config)
+            ld.write_sessions(sessions, ibgp_config)
+
+            def from_config():
+                config = {}
+                for router, router_type, servers in ld.read_sessions(sessions):
+                    config[router] = ns.init_bgp_config([], servers, router_type)
+                for router in config:
+                    for server in config[router]['server']:
+                        config[server]['client'].append(router)
+                s = ns.Simulator(read_config(links), config)
+                for router in s.routers.values():
+                    router.start_iBGP_session(config)
+
+            t_config, peak_config = time_and_peak(from_config)
+            t_stream, peak_stream = time_and_peak(lambda: ns.load(links, sessions))
+            print("%8d %8d %12.2f %12.2f %12.1f %12.1f" % (
+                n, n * 4, t_config, t_stream, peak_config / 2 ** 20, peak_stream / 2 ** 20))
+
+
+# generators of the benchmark suite, each builds a graph of about n routers
+SUITE_TOPOLOGIES = {
+    'ring': lambda n: tp.ring(n, max_cost=10),
+    'grid': lambda n: tp.grid(max(1, round(n ** 0.5)), max(1, round(n ** 0.5)), max_cost=10),
+    # 5k^2/4 switches, k rounded to the closest even number
+    'fat_tree': lambda n: tp.fat_tree(max(2, 2 * round((4 * n / 5) ** 0.5 / 2)), max_cost=10),
+    'waxman': lambda n: tp.waxman(n),
+    'barabasi_albert': lambda n: tp.barabasi_albert(n, max_cost=10),
+}
+
+
+# time the Simulator operations on one topology, one record per operation
+# every timing is the mean over `samples` random instances of the operation
+def suite_records(name, graph_config, samples=20, prefixes=1000) -> list:
+    n, links = len(graph_config), tp.count_links(graph_config)
+    records = []
+
+    def record(operation, seconds):
+        records.append({'topology': name, 'nodes': n, 'links': links,
+                        'operation': operation, 'seconds': seconds})
+
+    ibgp_config = tp.reflector_config(graph_config)
+    start = time.perf_counter()
+    s = ns.Simulator(graph_config, ibgp_config)
+    record('build', time.perf_counter() - start)
+    for router in s.routers.values():
+        router.start_iBGP_session(ibgp_config)
+    rng = random.Random(0)
+    nodes = list(graph_config)
+    link_list = [(a, b) for a in graph_config for b in graph_config[a] if a < b]
+    start = time.perf_counter()
+    for a, b in rng.sample(link_list, min(samples, len(link_list))):
+        s.update_link_cost(a, b, rng.randint(1, 10))
+    record('update_link_cost', (time.perf_counter() - start) / min(samples, len(link_list)))
+    allow_all(s, nodes)
+    pairs = [(rng.choice(nodes), rng.choice(nodes)) for _ in range(samples)]
+    # route_packet prints every hop
+    with open(os.devnull, 'w') as null, contextlib.redirect_stdout(null):
+        start = time.perf_counter()
+        for a, b in pairs:
+            s.route_packet(a, b)
+        record('route_packet', (time.perf_counter() - start) / samples)
+    start = time.perf_counter()
+    for a, b in pairs:
+        s.check_node_reachability(a, b)
+    record('check_node_reachability', (time.perf_counter() - start) / samples)
+    start = time.perf_counter()
+    for prefix in range(n, n + prefixes):
+        s.insert_eBGP(prefix, nodes[0])
+    record('insert_eBGP', (time.perf_counter() - start) / prefixes)
+    # tear down and restore the session of the first border router with a
+    # route reflector, which carries every prefix
+    server = nodes[0]
+    client = ibgp_config[server]['client'][0]
+    start = time.perf_counter()
+    s.delete_iBGP(server, client)
+    record('delete_iBGP', time.perf_counter() - start)
+    start = time.perf_counter()
+    s.start_iBGP(server, client)
+    record('start_iBGP', time.perf_counter() - start)
+    s.close()
+    return records
+
+
+# run the suite over every topology and size, printing a table and
+# returning the records
+def suite(sizes, topologies=None) -> list:
+    records = []
+    print("%-16s %8s %8s %-24s %12s" % ("topology", "V", "E", "operation", "ms"))
+    for name in topologies or SUITE_TOPOLOGIES:
+        for n in sizes:
+            for rec in suite_records(name, SUITE_TOPOLOGIES[name](n)):
+                print("%-16s %8d %8d %-24s %12.3f" % (rec['topology'], rec['nodes'], rec['links'],
+                                                       rec['operation'], rec['seconds'] * 1000))
+                records.append(rec)
+    return records
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--suite', action='store_true',
+                        help="time the Simulator operations on the generated topologies")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 500])
+    parser.add_argument('--topologies', nargs='+', choices=list(SUITE_TOPOLOGIES))
+    parser.add_argument('--json', help="write the suite records to this file")
+    args = parser.parse_args()
+    if args.suite:
+        records = suite(args.sizes, args.topologies)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(records, f, indent=1)
+    else:
+        bench_dijkstra()
+        bench_build()
+        bench_link_updates()
+        bench_batch_updates()
+        bench_route_flows()
+        bench_acl()
+        bench_reachability()
+        bench_verify_all()
+        bench_next_hop()
+        bench_insert_eBGP()
+        bench_delete_iBGP()
+        bench_hot_potato()
+        bench_events()
+        bench_packets()
+        bench_parallel()
+        bench_fork()
+        bench_failures()
+        bench_ecmp()
+        bench_traffic()
+        bench_load()
@@ -1,35 +1,103 @@
 from mimetypes import init
+import network_simulator.bgp as bgp
+import network_simulator.events as ev
+import network_simulator.failure as fa
+import network_simulator.forwarding as fw
+import network_simulator.graph as g
+import network_simulator.loader as ld
 import network_simulator.router as r
 import network_simulator.packet as p
-from copy import deepcopy
+import network_simulator.routing as rt
+import network_simulator.traffic as tr
+import network_simulator.verify as v
+import weakref
+from array import array
+from contextlib import contextmanager
+from copy import copy, deepcopy
 
 class Simulator:
-    def __init__(self, graph_config: dict, ibgp_config: dict):
+    # with workers > 1 the routing tables of all routers, and the ones a link
+    # batch recomputes, are computed by that many processes; call close()
+    # to stop them
+    # with ecmp, packets are spread over every equal-cost next hop by a hash
+    # of their flow, see Middlebox.get_next_hops
+    # graph_config may also be a graph.Graph and ibgp_config a loader.Sessions,
+    # as load builds them from files
+    def __init__(self, graph_config: dict, ibgp_config: dict, workers=None, ecmp=False):
         self.graph_config = graph_config
         self.ibgp_config = ibgp_config
         # routers indexed by distinct router id
         self.routers = {}
+        # one topology and one set of shortest path trees shared by all routers
+        if not isinstance(graph_config, g.Graph):
+            graph_config = g.Graph(graph_config)
+        self.engine = rt.RoutingEngine(graph_config, workers, ecmp)
         self.configure_routers()
+        # work-list propagating iBGP updates between the routers
+        self.bgp = bgp.Propagator(self.routers)
+        # simulated clock of the timed operations, see run_events
+        self.clock = ev.Scheduler()
+        # traffic matrices kept up to date with the routing, see traffic_matrix
+        self.matrices = weakref.WeakSet()
         # no eBGP is considered at the moment
         # self.init_eBGP()
         
     # initializer function that instantiate each router and put it into the routers dictionary
     def configure_routers(self):
-        # configure routers based on the ibgp_config dictionary
-        for i in self.ibgp_config.keys():
-            if self.ibgp_config[i]["type"] == 1:
+        if isinstance(self.ibgp_config, ld.Sessions):
+            types = list(self.ibgp_config.routers())
+        else:
+            types = [(i, config["type"]) for i, config in self.ibgp_config.items()]
+        # compute the first hops of every router in one batch,
+        # each router then reads its own row on first use
+        self.engine.compute_all([i for i, _ in types])
+        # configure routers based on their types
+        for i, router_type in types:
+            if router_type == 1:
                 # regular routers
-                self.routers[i] = r.Router(i, self.graph_config.copy())
-            elif self.ibgp_config[i]["type"] == 2:
+                self.routers[i] = r.Router(i, self.graph_config, self.engine)
+            elif router_type == 2:
                 # route reflector
-                self.routers[i] = r.RR(i, self.graph_config.copy())
+                self.routers[i] = r.RR(i, self.graph_config, self.engine)
             else:
                 # boarder router
-                self.routers[i] = r.Border(i, self.graph_config.copy())
+                self.routers[i] = r.Border(i, self.graph_config, self.engine)
             # start bgp sessions based on the input configuration file
             # could be skipped when only considering igp
             # self.routers[i].start_iBGP_session(self.ibgp_config.copy())
 
+    # stop the worker processes of the routing engine, if any
+    def close(self) -> None:
+        self.engine.close()
+
+    # independent copy of the simulator for what-if analysis
+    # the topology, shortest path trees, routing tables, access lists and
+    # RIBs stay shared with this simulator, whichever side changes one of
+    # them first copies that piece only; forking copies the router objects
+    # and nothing else, dropping a fork needs no cleanup
+    # pending events and iBGP messages are not carried over, and the fork
+    # borrows the worker pool of this simulator, which only close() here stops
+    def fork(self) -> 'Simulator':
+        other = copy(self)
+        other.engine = self.engine.fork()
+        other.routers = {i: router.fork(other.engine) for i, router in self.routers.items()}
+        other.clock = ev.Scheduler()
+        other.clock.now = self.clock.now
+        other.matrices = weakref.WeakSet()
+        other.use_timed_bgp(isinstance(self.bgp, ev.TimedPropagator))
+        return other
+
+    # the traffic matrices stay with this simulator, a pickled copy (like the
+    # baseline a failure sweep sends its worker processes) starts without any
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        del state['matrices']
+        return state
+
+    def __setstate__(self, state) -> None:
+        self.__dict__.update(state)
+        self.matrices = weakref.WeakSet()
+
     # return a single router object based on id given
     def get_router(self, router_id):
         return self.routers[router_id]
@@ -39,27 +107,181 @@ class Simulator:
         return deepcopy(self.routers)
 
     # function to route a packet from a host to another host in the network
-    def route_packet(self, sender, receiver):
+    # every hop is printed, use send_packet for a silent run
+    def route_packet(self, sender, receiver) -> fw.ForwardingResult:
+        return self.send_packet(sender, receiver, fw.print_tracer)
+
+    # send a packet without printing and return a forwarding.ForwardingResult
+    # the optional tracer gets every per-hop event, see Middlebox.forward
+    # path_limit selects how the path is recorded, see packet.Packet
+    # flow labels the packet for the ECMP hash
+    def send_packet(self, sender, receiver, tracer=None, path_limit=p.PATH_FULL, flow=0) -> fw.ForwardingResult:
         # initialize a new packet
-        pk = p.Packet(sender, receiver)
-        router = sender
+        pk = p.Packet(sender, receiver, path_limit, flow)
+        last = self.walk_packet(pk, tracer)
+        outcome = pk.get_outcome()
+        denied_by = last if outcome == fw.Outcome.DENIED else None
+        return fw.ForwardingResult(outcome, pk.get_path(), pk.get_TTL(), denied_by)
+
+    # forward a packet from its sender until it is terminated
+    # returns the last router that handled it
+    def walk_packet(self, pk: p.Packet, tracer=None):
+        router = pk.get_sender()
+        last = router
         # stops when the packet is terminated
         while not pk.has_terminate() and router != None:
-            print("########## Packet at router", router, "##########")
+            if tracer is not None:
+                tracer(fw.ARRIVE, router, pk, None)
+            last = router
             # gets the router id for the next hop
-            router = self.routers[router].route(pk)
+            router = self.routers[router].forward(pk, tracer)
+        return last
+
+    # send many packets through the routers, senders and receivers being
+    # aligned sequences of router ids; the packets come from a pool and are
+    # reused, paths are only kept when path_limit records them
+    # flows optionally gives the aligned flow labels of the packets
+    # returns forwarding.FlowResults like route_flows
+    def send_packets(self, senders, receivers, path_limit=p.PATH_OFF, tracer=None, flows=None) -> fw.FlowResults:
+        n = len(senders)
+        outcome = array('b', [0]) * n
+        hops = array('i', [0]) * n
+        paths = [None] * n if path_limit != p.PATH_OFF else None
+        pool = p.PacketPool(path_limit)
+        for f in range(n):
+            pk = pool.acquire(senders[f], receivers[f], 0 if flows is None else flows[f])
+            self.walk_packet(pk, tracer)
+            outcome[f] = pk.outcome
+            # links crossed, a denied packet was not stamped by the last router
+            hops[f] = pk.hops if pk.outcome == fw.Outcome.DENIED else pk.hops - 1
+            if paths is not None:
+                paths[f] = tuple(pk.get_path())
+            pool.release(pk)
+        return fw.FlowResults(outcome, hops, paths)
+
+    # dense next hop matrix of the current routing tables, rebuild it after
+    # changing the routing to reuse it across several route_flows calls
+    def build_next_hop_matrix(self) -> fw.NextHopMatrix:
+        return fw.NextHopMatrix(self.routers)
+
+    # forward many flows at once without printing, senders and receivers are
+    # aligned sequences of router ids, returns per flow outcome codes
+    # (forwarding.Outcome), hop counts and, when asked for, paths
+    # flows optionally gives the aligned flow labels for the ECMP hash
+    def route_flows(self, senders, receivers, record_paths=False, matrix=None, flows=None) -> fw.FlowResults:
+        if matrix is None:
+            matrix = self.build_next_hop_matrix()
+        return fw.forward_flows(matrix, senders, receivers, record_paths=record_paths, flows=flows)
+
+    ########################################################################
+    ################################Events##################################
+    ########################################################################
+
+    # run the scheduled events in time order, until a time or an event count
+    # when given, returns the number of events run; the clock is at self.clock.now
+    def run_events(self, until=None, max_events=None) -> int:
+        return self.clock.run(until, max_events)
+
+    # send a packet as timed events, one per hop, starting at the given time
+    # (now by default); packets forwarded during a convergence see the routing
+    # tables of the moment they reach each hop
+    # done(packet, time) is called once the packet is terminated
+    # a packet taken from a pool goes back to it after done returned
+    def schedule_packet(self, sender, receiver, at=None, done=None, path_limit=p.PATH_FULL, pool=None) -> p.Packet:
+        if pool is None:
+            pk = p.Packet(sender, receiver, path_limit)
+        else:
+            pk = pool.acquire(sender, receiver)
+        ev.send_packet(self, pk, at, done, pool)
+        return pk
+
+    # change a link at the given time with update_link_cost semantics
+    def schedule_link_update(self, l1, l2, cost, at) -> None:
+        self.clock.at(at, self.update_link_cost, l1, l2, cost)
+
+    # deliver iBGP messages as timed events, sessions taking the delay of
+    # the IGP path between the routers; the BGP operations then only
+    # schedule their messages, run_events delivers them
+    def use_timed_bgp(self, timed=True) -> None:
+        if timed:
+            # messages delivered by run_events change routes, which the
+            # traffic matrices learn through routing_changed
+            self.bgp = ev.TimedPropagator(self.routers, self.clock, self.session_delay,
+                                          changed=self.routing_changed)
+        else:
+            self.bgp = bgp.Propagator(self.routers)
+
+    def link_delay(self, a, b):
+        return self.engine.graph.get_delay(a, b)
+
+    # delay along the forwarding path from a to b, None without a path
+    def session_delay(self, a, b):
+        delay = 0
+        router = a
+        for _ in range(len(self.routers)):
+            if router == b:
+                return delay
+            nh = self.routers[router].routing_table.get(b)
+            if nh is None or nh not in self.routers:
+                return None
+            delay += self.link_delay(router, nh)
+            router = nh
+        return delay if router == b else None
+
+    ########################################################################
+    ########################################################################
+    ########################################################################
 
     ########################################################################
     ###############################Checker##################################
     ########################################################################
 
     # check reachability of all paths between two nodes
-    def check_node_reachability(self, a, b):
-        paths = self.generate_possible_paths(a, b, [])
-        cond = False
-        for p in paths:
-            cond = cond or self.check_path_reachability(p)
-        return cond
+    def check_node_reachability(self, a, b) -> bool:
+        return self.analyze_reachability(a, b).reachable
+
+    # follow the forwarding state from a towards b, the ACL of every router on
+    # the way but b is checked as check_path_reachability does; only one path
+    # can match the next hops, so this is linear in its length
+    def analyze_reachability(self, a, b) -> fw.Reachability:
+        path = [a]
+        seen = {a}
+        router_id = a
+        while router_id != b:
+            router = self.routers[router_id]
+            if not router.check_acl(a, b):
+                return fw.Reachability(False, path, router_id, fw.Outcome.DENIED)
+            nh = router.routing_table.get(b, fw.NO_ROUTE)
+            if nh is None:
+                return fw.Reachability(False, path, router_id, fw.Outcome.EXITED)
+            if nh == fw.NO_ROUTE or nh not in self.routers or \
+                    not self.engine.graph.has_link(router_id, nh):
+                return fw.Reachability(False, path, router_id, fw.Outcome.UNREACHABLE)
+            path.append(nh)
+            if nh in seen:
+                return fw.Reachability(False, path, router_id, fw.Outcome.LOOP)
+            seen.add(nh)
+            router_id = nh
+        return fw.Reachability(True, path)
+
+    # check every (src, dst) pair at once, against all routers or the given
+    # destinations, returns a verify.ReachabilityMatrix of Outcome codes
+    def verify_all(self, destinations=None) -> v.ReachabilityMatrix:
+        return v.verify_all(self, destinations)
+
+    # link loads of the given demands, {(src, dst): volume}, forwarded over
+    # the current routing tables; the returned traffic.TrafficMatrix follows
+    # later link, static route and BGP changes made through the simulator
+    def traffic_matrix(self, demands: dict) -> tr.TrafficMatrix:
+        return tr.TrafficMatrix(self, demands)
+
+    # impact of link failures on the current state, the simulator itself is
+    # left untouched: scenarios is a list of link lists failing together,
+    # every single link by default (N-1), see failure.link_combinations for
+    # N-k; with workers > 1 the scenarios run on that many processes
+    # returns one failure.Failure per scenario, in order
+    def failure_sweep(self, scenarios=None, workers=None) -> list:
+        return fa.sweep(self, scenarios, workers)
 
     # check reachability on a given path
     def check_path_reachability(self, path: list) -> bool:
@@ -82,7 +304,7 @@ class Simulator:
         if a == b:
             return [path]
         paths = []
-        nhs = self.graph_config[a]
+        nhs = self.engine.graph.map[a]
         for nh in nhs.keys():
             if nh not in path:
                 new_path = path.copy()
@@ -92,9 +314,60 @@ class Simulator:
         return paths
     
     # update weight of a link given two neighbors
-    def update_link_cost(self, l1, l2, cost):
-        for i in self.routers.values():
-            i.update_graph(l1, l2, cost)
+    # returns the next hops that changed as {(router, dst): (old, new)}
+    def update_link_cost(self, l1, l2, cost) -> dict:
+        # the topology is shared, so the link is changed once for all routers
+        # and only the shortest path trees running through it are repaired
+        before = self.engine.graph.version
+        changes = self.engine.update_link(l1, l2, cost)
+        return self.apply_routing_changes(changes, before)
+
+    # stage link changes and recompute the routing tables once when the block
+    # exits, the next hops that changed are stored in the batch's delta
+    #   with s.link_updates() as batch:
+    #       batch.update_cost(0, 1, 4)
+    #       batch.destroy_link(1, 2)
+    @contextmanager
+    def link_updates(self):
+        batch = rt.LinkBatch()
+        yield batch
+        before = self.engine.graph.version
+        batch.delta = self.apply_routing_changes(self.engine.commit(batch), before)
+
+    # apply a list of (l1, l2, cost) updates with update_link_cost semantics
+    # but a single recomputation, returns the next hops that changed
+    def apply_link_updates(self, updates) -> dict:
+        with self.link_updates() as batch:
+            for l1, l2, cost in updates:
+                batch.update_link(l1, l2, cost)
+        return batch.delta
+
+    # push the changes computed by the routing engine to the routers
+    # every router is brought to the current topology version, including
+    # the ones whose table did not change
+    def apply_routing_changes(self, changes: dict, before=None) -> dict:
+        delta = {}
+        for router_id, router in self.routers.items():
+            router_changes = changes.get(router_id, {})
+            for dst, nh in router.apply_routing_changes(router_changes, before).items():
+                delta[(router_id, dst)] = nh
+        self.routing_changed({dst for _, dst in delta})
+        return delta
+
+    # mark the destinations routed differently in every traffic matrix,
+    # all of their destinations when none are given
+    def routing_changed(self, dsts=None) -> None:
+        for matrix in self.matrices:
+            if dsts is None:
+                matrix.refresh()
+            else:
+                matrix.invalidate(dsts)
+
+    # destinations whose route at a router follows a static route change,
+    # the destination itself and the BGP prefixes behind it
+    def static_route_changed(self, src, dst) -> None:
+        if self.matrices:
+            self.routing_changed([dst] + self.routers[src].rib.depending_on([dst]))
 
     ########################################################################
     ########################################################################
@@ -111,6 +384,7 @@ class Simulator:
         if not router.get_route_mode(dst):
             router.dynamic_to_static(dst)
         router.add_static_route(dst, nh)
+        self.static_route_changed(src, dst)
 
     # delete a static route from the graph
     def del_static_route(self, src, dst):
@@ -118,6 +392,7 @@ class Simulator:
         # first check if the route is in static mode
         if router.get_route_mode(dst):
             router.remove_static_route(dst)
+            self.static_route_changed(src, dst)
 
     # switch route mode to dynamic
     def switch_route_mode(self, src, dst):
@@ -125,6 +400,7 @@ class Simulator:
         # first checks if the router is under static mode
         if router.get_route_mode(dst):
             router.static_to_dynamic(dst)
+            self.static_route_changed(src, dst)
     
     ########################################################################
     ########################################################################
@@ -151,22 +427,26 @@ class Simulator:
     ########################################################################
     ################################BGP#####################################
     ########################################################################
+    # deliver the pending iBGP messages, the BGP prefixes may be routed
+    # differently afterwards
+    def run_bgp(self) -> None:
+        self.bgp.run()
+        self.routing_changed()
+
     def insert_eBGP(self, prefix, gateway):
         ad = self.routers[gateway].insert_eBGP(prefix)
         client = self.routers[gateway].get_iBGP_client()
-        for c in client:
-            self.update_iBGP_recursive(c, ad)
-        # while len(client):
-        #     nc = []
-        #     for c in client:
-        #         argv = self.routers[c].receive_iBGP_ad(ad)
-        #         if argv != None:
-        #             nad = argv[0]
-        #             nc += argv[1]
-        #     ad = nad
-        #     client = nc
-        # for i in self.routers.keys():
-        #     print(self.routers[i].get_id(), self.routers[i].get_routing_table())
+        self.bgp.advertise(client, ad)
+        self.run_bgp()
+
+    # install a full table of external prefixes on a border router, only the
+    # new prefixes are advertised and each receiving router handles them in
+    # one batch
+    def insert_eBGP_table(self, prefixes, gateway):
+        ad = self.routers[gateway].insert_eBGP_table(prefixes)
+        client = self.routers[gateway].get_iBGP_client()
+        self.bgp.advertise(client, ad)
+        self.run_bgp()
 
     def start_iBGP(self, server, client):
         ibgp_update = {}
@@ -177,44 +457,29 @@ class Simulator:
         # advertise the new client the route
         client = [client]
         ad = self.routers[server].draft_iBGP_ad()
-        for c in client:
-            self.update_iBGP_recursive(c, ad)
-        # for i in self.routers.keys():
-        #     print(self.routers[i].get_id(), self.routers[i].get_routing_table())
+        self.bgp.advertise(client, ad)
+        self.run_bgp()
 
+    # deliver an advertisement to a client and everything it reflects to
     def update_iBGP_recursive(self, client, ad):
-        argv = self.routers[client].receive_iBGP_ad(ad)
-        if argv != None:
-            for i in argv[1]:
-                self.update_iBGP_recursive(i, argv[0])
+        self.bgp.advertise([client], ad)
+        self.run_bgp()
 
     def delete_iBGP(self, server, client):
         self.routers[server].destroy_iBGP_session()
         advert = server
-        # print("server", server)
         nclient = self.routers[client].destroy_iBGP_session([server], advert, 'client')
-        # print("router", client, nclient)
         if nclient != None and nclient[0] != None:
-            for c in nclient[0]:
-                self.del_iBGP_recursive(c, server, nclient[1])
-                print("Router", nclient)
-                if nclient[2] != None:
-                    self.update_iBGP_recursive(c, nclient[2])
-        # while client != None and len(client):
-        #     nc = []
-        #     if client != None:
-        #         for c in client:
-        #             nc += self.routers[c].remove_iBGP_ad(server)
-        #     client = nc
-        # for i in self.routers.keys():
-        #     print(self.routers[i].get_id(), self.routers[i].get_routing_table())
+            # withdrawals are processed before the new advertisement at each router
+            self.bgp.withdraw(nclient[0], server, nclient[1])
+            for ad in nclient[2] or ():
+                self.bgp.advertise(nclient[0], ad)
+            self.run_bgp()
 
+    # withdraw the routes of a gateway from a client and everything it reflects to
     def del_iBGP_recursive(self, client, router, advert):
-        argv = self.routers[client].remove_iBGP_ad(router, advert)
-        # print(client, argv)
-        if argv != None:
-            for i in argv[0]:
-                self.del_iBGP_recursive(i, router, argv[1])
+        self.bgp.withdraw([client], router, advert)
+        self.run_bgp()
  
     def init_eBGP(self):
         self.insert_eBGP(6, 0)    
@@ -228,6 +493,16 @@ class Simulator:
 def init_bgp_config(client, server, router_type) -> dict:
     return {"client": client, "server": server, "type": router_type}
 
+
+# simulator of a links file and a sessions file, see loader for the formats
+# the files are streamed into the CSR adjacency and the routers, with the
+# iBGP sessions of the file open but nothing advertised yet
+def load(links, sessions, workers=None, ecmp=False) -> Simulator:
+    sessions = ld.Sessions(sessions)
+    s = Simulator(ld.load_graph(links, sessions.ids), sessions, workers, ecmp)
+    sessions.start(s.routers)
+    return s
+
 def main():
     # define a new packet
     # graph_config = {
@@ -0,0 +1,384 @@
+from bisect import bisect_left, bisect_right
+
+# a rule field matching every router
+ANY = "*"
+
+# source matching only ANY source fields, see AccessList.check_dst
+NO_SOURCE = object()
+
+
+# whether a rule field matches a single value, the other kinds are ANY and
+# range objects, range(lo, hi) matching every lo <= x < hi
+def is_exact(value) -> bool:
+    if isinstance(value, range):
+        if value.step != 1 or not value:
+            raise ValueError("ACL ranges must be non-empty with a step of 1")
+        return False
+    return value != ANY
+
+
+# one level of the classification trie used for non-exact rules
+# children are found by exact value, by covering range or as wildcard; the
+# ranges are cut into elementary intervals, each holding the children of
+# every range covering it, so a lookup is a dict hit plus one bisection
+class Level:
+    def __init__(self):
+        self.exact = {}
+        self.ranges = {}
+        self.any = None
+        # interval boundaries and the children covering each interval,
+        # rebuilt on the next lookup after the ranges changed
+        self.bounds = None
+        self.segments = None
+
+    def is_empty(self) -> bool:
+        return not self.exact and not self.ranges and self.any is None
+
+    # child stored under a field value, created with factory if missing
+    def child(self, value, factory=None):
+        if isinstance(value, range):
+            key = (value.start, value.stop)
+            node = self.ranges.get(key)
+            if node is None and factory is not None:
+                node = self.ranges[key] = factory()
+                self.bounds = None
+        elif value == ANY:
+            node = self.any
+            if node is None and factory is not None:
+                node = self.any = factory()
+        else:
+            node = self.exact.get(value)
+            if node is None and factory is not None:
+                node = self.exact[value] = factory()
+        return node
+
+    def remove_child(self, value) -> None:
+        if isinstance(value, range):
+            del self.ranges[(value.start, value.stop)]
+            self.bounds = None
+        elif value == ANY:
+            self.any = None
+        else:
+            del self.exact[value]
+
+    # every child whose field matches x
+    def match(self, x) -> list:
+        found = []
+        node = self.exact.get(x)
+        if node is not None:
+            found.append(node)
+        if self.ranges:
+            if self.bounds is None:
+                self.cut()
+            try:
+                k = bisect_right(self.bounds, x) - 1
+            except TypeError:
+                # x cannot be ordered against the range boundaries
+                k = -1
+            if k >= 0:
+                found.extend(self.segments[k])
+        if self.any is not None:
+            found.append(self.any)
+        return found
+
+    def cut(self) -> None:
+        self.bounds = sorted({b for key in self.ranges for b in key})
+        self.segments = [[] for _ in self.bounds]
+        for (lo, hi), node in self.ranges.items():
+            for k in range(bisect_left(self.bounds, lo), bisect_left(self.bounds, hi)):
+                self.segments[k].append(node)
+
+
+# room left between the order keys of rules appended one after the other
+GAP = 1 << 32
+# a chunk of the rule order is split in two once it holds more rules
+CHUNK = 512
+
+
+class Chunk:
+    __slots__ = ('entries', 'index')
+
+    def __init__(self, entries, index):
+        # [order key, rule, chunk] of consecutive rules
+        self.entries = entries
+        # position of the chunk in Order.chunks
+        self.index = index
+
+
+# rules in priority order, kept in chunks so that installing or removing a
+# rule anywhere shifts one chunk rather than the whole list; a Fenwick tree
+# over the chunk sizes finds the chunk holding a position in O(log n)
+# every entry carries an integer order key growing with its position, so two
+# rules are ordered by comparing keys; a rule put between two neighbors
+# without a free key in between spreads out the keys of its chunk, or of a
+# window of chunks around it doubling until the keys fit with room to spare
+class Order:
+    def __init__(self):
+        self.chunks = []
+        # Fenwick tree of the chunk sizes, 1-based
+        self.tree = [0]
+        self.size = 0
+        # the rules as a list, built on first use after a change
+        self.cached = None
+
+    def __len__(self) -> int:
+        return self.size
+
+    def rules(self) -> list:
+        if self.cached is None:
+            self.cached = [entry[1] for chunk in self.chunks for entry in chunk.entries]
+        return self.cached
+
+    def first(self):
+        return self.chunks[0].entries[0][1] if self.size else None
+
+    def grow(self, c, step) -> None:
+        c += 1
+        while c < len(self.tree):
+            self.tree[c] += step
+            c += c & -c
+
+    # number of rules in the first c chunks
+    def prefix(self, c) -> int:
+        total = 0
+        while c:
+            total += self.tree[c]
+            c -= c & -c
+        return total
+
+    # renumber the chunks from c on and rebuild the tree after chunks came or went
+    def rebuild(self, c=0) -> None:
+        for k in range(c, len(self.chunks)):
+            self.chunks[k].index = k
+        self.tree = [0] * (len(self.chunks) + 1)
+        for k, chunk in enumerate(self.chunks, 1):
+            self.tree[k] += len(chunk.entries)
+            parent = k + (k & -k)
+            if parent < len(self.tree):
+                self.tree[parent] += self.tree[k]
+
+    # chunk and offset of a position, the end of the last chunk for size
+    def locate(self, pos) -> tuple:
+        if pos >= self.size:
+            return len(self.chunks) - 1, len(self.chunks[-1].entries)
+        c = 0
+        step = 1 << len(self.chunks).bit_length()
+        while step:
+            k = c + step
+            if k < len(self.tree) and self.tree[k] <= pos:
+                c = k
+                pos -= self.tree[k]
+            step >>= 1
+        return c, pos
+
+    # entry of a new rule at pos, following list.insert
+    def insert(self, pos, rule) -> list:
+        self.cached = None
+        if not self.chunks:
+            self.chunks.append(Chunk([], 0))
+            self.tree = [0, 0]
+        c, k = self.locate(pos)
+        chunk = self.chunks[c]
+        entries = chunk.entries
+        if k:
+            lo = entries[k - 1][0]
+        else:
+            lo = self.chunks[c - 1].entries[-1][0] if c else None
+        if k < len(entries):
+            hi = entries[k][0]
+        else:
+            hi = self.chunks[c + 1].entries[0][0] if c + 1 < len(self.chunks) else None
+        if lo is None:
+            key = 0 if hi is None else hi - GAP
+        elif hi is None:
+            key = lo + GAP
+        else:
+            key = (lo + hi) // 2
+            if key == lo:
+                key = None
+        entry = [key, rule, chunk]
+        entries.insert(k, entry)
+        self.size += 1
+        self.grow(c, 1)
+        if key is None:
+            self.relabel(c)
+        if len(entries) > CHUNK:
+            half = len(entries) // 2
+            right = Chunk(entries[half:], c + 1)
+            del entries[half:]
+            for moved in right.entries:
+                moved[2] = right
+            if c + 1 == len(self.chunks):
+                # appending a chunk only extends the tree
+                self.grow(c, -len(right.entries))
+                self.chunks.append(right)
+                k = len(self.tree)
+                self.tree.append(len(right.entries) + self.prefix(k - 1) - self.prefix(k - (k & -k)))
+            else:
+                self.chunks.insert(c + 1, right)
+                self.rebuild(c + 1)
+        return entry
+
+    def remove(self, entry) -> None:
+        self.cached = None
+        chunk = entry[2]
+        del chunk.entries[bisect_left(chunk.entries, [entry[0]])]
+        self.size -= 1
+        self.grow(chunk.index, -1)
+        if not chunk.entries and len(self.chunks) > 1:
+            del self.chunks[chunk.index]
+            self.rebuild(chunk.index)
+
+    # spread out the keys around chunk c, the relative order stays the same
+    def relabel(self, c) -> None:
+        chunks = self.chunks
+        w = 0
+        while True:
+            a, b = max(0, c - w), min(len(chunks), c + w + 1)
+            n = sum(len(chunks[k].entries) for k in range(a, b))
+            lo = chunks[a - 1].entries[-1][0] if a else None
+            hi = chunks[b].entries[0][0] if b < len(chunks) else None
+            if lo is None:
+                lo = (0 if hi is None else hi) - GAP * (n + 1)
+            if hi is None:
+                hi = lo + GAP * (n + 1)
+            step = (hi - lo) // (n + 1)
+            if step >= GAP >> 16 or (a == 0 and b == len(chunks)):
+                break
+            w = 2 * w + 1
+        key = lo
+        for k in range(a, b):
+            for entry in chunks[k].entries:
+                key += step
+                entry[0] = key
+
+
+# access-control list with a first-match index
+# rules stay in an Order of {"act", "src", "dst"} dictionaries by priority,
+# next to it every (src, dst) pair maps to its rules ordered by position, so
+# neither a check nor the duplicate test on insert has to scan the rules
+# rules using ANY or ranges go into a two-level trie (src, then dst) instead,
+# a check takes the earliest rule among the exact and the trie matches
+class AccessList:
+    def __init__(self):
+        # rules in priority order, the first matching rule decides; the order
+        # key of an entry tells the relative order of two rules without
+        # looking up their positions
+        self.order = Order()
+        # (src, dst) -> entries matching it, sorted by order key
+        self.index = {}
+        # (act, src, dst) of every installed rule
+        self.keys = set()
+        # trie of the rules that are not exact on both fields
+        self.trie = Level()
+        self.wildcards = 0
+        # number of rules with a source other than ANY, per exact destination
+        # and for every other destination field
+        self.by_src = {}
+        self.by_src_wild = 0
+        # number of rules with ANY on both fields
+        self.any_any = 0
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    # the rules as a list in priority order, built on first use after a change
+    @property
+    def rules(self) -> list:
+        return self.order.rules()
+
+    # decision of the first rule matching the pair, denied if none matches
+    def check(self, src, dst) -> bool:
+        bucket = self.index.get((src, dst))
+        best = bucket[0] if bucket else None
+        if self.wildcards:
+            for level in self.trie.match(src):
+                for bucket in level.match(dst):
+                    if best is None or bucket[0][0] < best[0]:
+                        best = bucket[0]
+        if best is not None:
+            return best[1]["act"]
+        return False
+
+    # decision when it is the same for every pair, None otherwise
+    def check_all(self):
+        if self.any_any < len(self.order):
+            return None
+        return self.order.first()["act"] if self.order else False
+
+    # decision for dst when it is the same for every source, None otherwise
+    def check_dst(self, dst):
+        if self.by_src_wild or self.by_src.get(dst):
+            return None
+        return self.check(NO_SOURCE, dst)
+
+    def count_source(self, rule: dict, step) -> None:
+        if rule["src"] == ANY:
+            if rule["dst"] == ANY:
+                self.any_any += step
+            return
+        if is_exact(rule["dst"]):
+            count = self.by_src.get(rule["dst"], 0) + step
+            if count:
+                self.by_src[rule["dst"]] = count
+            else:
+                del self.by_src[rule["dst"]]
+        else:
+            self.by_src_wild += step
+
+    # entries of the rules with exactly these fields, created if asked for
+    def bucket(self, src, dst, create=False) -> list:
+        if is_exact(src) and is_exact(dst):
+            if create:
+                return self.index.setdefault((src, dst), [])
+            return self.index.get((src, dst))
+        level = self.trie.child(src, Level if create else None)
+        if level is None:
+            return None
+        return level.child(dst, list if create else None)
+
+    def drop_bucket(self, src, dst) -> None:
+        if is_exact(src) and is_exact(dst):
+            del self.index[(src, dst)]
+            return
+        level = self.trie.child(src)
+        level.remove_child(dst)
+        if level.is_empty():
+            self.trie.remove_child(src)
+
+    # insert a rule at pos following list.insert, -1 appends
+    def add(self, rule: dict, pos=-1) -> bool:
+        key = (rule["act"], rule["src"], rule["dst"])
+        if key in self.keys:
+            return False
+        n = len(self.order)
+        if pos == -1 or pos >= n:
+            pos = n
+        elif pos < 0:
+            pos = max(0, n + pos)
+        entry = self.order.insert(pos, rule)
+        bucket = self.bucket(rule["src"], rule["dst"], create=True)
+        bucket.insert(bisect_left(bucket, [entry[0]]), entry)
+        self.keys.add(key)
+        if not (is_exact(rule["src"]) and is_exact(rule["dst"])):
+            self.wildcards += 1
+        self.count_source(rule, 1)
+        return True
+
+    def remove(self, rule: dict) -> bool:
+        key = (rule["act"], rule["src"], rule["dst"])
+        if key not in self.keys:
+            return False
+        self.keys.remove(key)
+        bucket = self.bucket(rule["src"], rule["dst"])
+        for entry in bucket:
+            if entry[1]["act"] == rule["act"]:
+                break
+        bucket.remove(entry)
+        if not bucket:
+            self.drop_bucket(rule["src"], rule["dst"])
+        if not (is_exact(rule["src"]) and is_exact(rule["dst"])):
+            self.wildcards -= 1
+        self.count_source(rule, -1)
+        self.order.remove(entry)
+        return True
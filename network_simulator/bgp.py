@@ -0,0 +1,84 @@
+from collections import deque
+import network_simulator.errors as e
+
+
+# queue-driven propagation of iBGP advertisements and withdrawals
+# messages wait in a work-list instead of being pushed recursively; messages
+# pending for the same router are merged, and an update that does not change
+# what the router already holds is dropped instead of being reflected again,
+# so propagation stops once every router has converged
+class Propagator:
+    def __init__(self, routers: dict, max_messages=None):
+        self.routers = routers
+        # budget of router updates per run, None for no limit
+        self.max_messages = max_messages
+        # routers with pending work, in arrival order
+        self.queue = deque()
+        # router -> advertiser -> {dest: gate} of the pending advertisements
+        self.pending_ads = {}
+        # router -> set of (gate, advertiser) pending withdrawals
+        self.pending_withdrawals = {}
+        # router updates processed during the last run
+        self.messages = 0
+
+    def advertise(self, clients, ad: dict) -> None:
+        for c in clients:
+            by_advertiser = self.pending(c, self.pending_ads, dict)
+            routes = by_advertiser.setdefault(ad['advertiser'], {})
+            for dest in ad['dest']:
+                # a later advertisement of the same advertiser replaces an earlier one
+                routes[dest] = ad['gate']
+
+    def withdraw(self, clients, gate, advertiser) -> None:
+        for c in clients:
+            self.pending(c, self.pending_withdrawals, set).add((gate, advertiser))
+
+    def pending(self, router_id, table: dict, factory):
+        if router_id not in self.pending_ads and router_id not in self.pending_withdrawals:
+            self.queue.append(router_id)
+        work = table.get(router_id)
+        if work is None:
+            work = table[router_id] = factory()
+        return work
+
+    # process the work-list until it is empty, returns the number of updates
+    def run(self) -> int:
+        self.messages = 0
+        while self.queue:
+            router_id = self.queue.popleft()
+            withdrawals = self.pending_withdrawals.pop(router_id, ())
+            ads = self.pending_ads.pop(router_id, {})
+            router = self.routers[router_id]
+            for gate, advertiser in withdrawals:
+                self.count()
+                argv = router.remove_iBGP_ad(gate, advertiser)
+                if argv is not None:
+                    self.withdraw(argv[0], gate, argv[1])
+                    # the routes that replace the withdrawn ones
+                    for ad in argv[2] or ():
+                        self.advertise(argv[0], ad)
+            for advertiser, routes in ads.items():
+                for ad in self.group(router, advertiser, routes):
+                    self.count()
+                    argv = router.receive_iBGP_ad(ad)
+                    if argv is not None:
+                        self.advertise(argv[1], argv[0])
+        return self.messages
+
+    # split merged routes into one advertisement per gate, leaving out the
+    # destinations the router already holds from this advertiser and gate
+    def group(self, router, advertiser, routes: dict) -> list:
+        by_gate = {}
+        for dest, gate in routes.items():
+            if not router.rib.has(dest, gate, advertiser):
+                by_gate.setdefault(gate, []).append(dest)
+        return [{'dest': dests, 'gate': gate, 'advertiser': advertiser}
+                for gate, dests in by_gate.items()]
+
+    def count(self) -> None:
+        self.messages += 1
+        if self.max_messages is not None and self.messages > self.max_messages:
+            self.queue.clear()
+            self.pending_ads.clear()
+            self.pending_withdrawals.clear()
+            raise e.ConvergenceError("iBGP did not converge within %d updates" % self.max_messages)
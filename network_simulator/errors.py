@@ -1,2 +1,7 @@
 class DestinationUnreachable():
-    pass
\ No newline at end of file
+    pass
+
+
+# raised when iBGP propagation exceeds its message budget without converging
+class ConvergenceError(Exception):
+    pass
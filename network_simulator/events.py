@@ -0,0 +1,164 @@
+from heapq import heappush, heappop
+import network_simulator.bgp as bgp
+import network_simulator.forwarding as fw
+
+
+# discrete-event scheduler with a simulated clock
+# events of the same time share a bucket, a FIFO of (fn, args), and only
+# the distinct times are kept in a binary heap; delays are mostly a few link
+# delays apart, so most events cost a list append and no heap operation
+# events of the same time run in scheduling order, so a run is deterministic
+# an event is a plain call fn(*args) at its time
+class Scheduler:
+    def __init__(self):
+        self.now = 0
+        # distinct pending times and the bucket of each
+        self.times = []
+        self.buckets = {}
+        self.pending = 0
+        # events run since the scheduler was created
+        self.processed = 0
+
+    def __len__(self) -> int:
+        return self.pending
+
+    # run fn(*args) at an absolute time, which cannot lie in the past
+    def at(self, time, fn, *args) -> None:
+        if time < self.now:
+            raise ValueError("cannot schedule an event at %s, the clock is at %s" % (time, self.now))
+        bucket = self.buckets.get(time)
+        if bucket is None:
+            self.buckets[time] = [(fn, args)]
+            heappush(self.times, time)
+        else:
+            bucket.append((fn, args))
+        self.pending += 1
+
+    # run fn(*args) after a delay
+    def schedule(self, delay, fn, *args) -> None:
+        self.at(self.now + delay, fn, *args)
+
+    # time of the next event, None when nothing is scheduled
+    def peek(self):
+        return self.times[0] if self.times else None
+
+    # run events in time order until the queue is empty, the next event lies
+    # after until, or max_events ran; events scheduled by running events are
+    # run in the same call, returns the number of events run
+    def run(self, until=None, max_events=None) -> int:
+        times = self.times
+        buckets = self.buckets
+        limit = float("inf") if max_events is None else max_events
+        n = 0
+        try:
+            while times and n < limit:
+                time = times[0]
+                if until is not None and time > until:
+                    break
+                self.now = time
+                # events scheduled for the current time while it runs are
+                # appended to the same bucket and run in this pass
+                bucket = buckets[time]
+                i = 0
+                try:
+                    while i < len(bucket) and n < limit:
+                        fn, args = bucket[i]
+                        i += 1
+                        n += 1
+                        fn(*args)
+                finally:
+                    # the events run are taken out even when one raised
+                    del bucket[:i]
+                if bucket:
+                    break
+                del buckets[time]
+                heappop(times)
+        finally:
+            self.pending -= n
+            self.processed += n
+        # the clock moves to the end of the window
+        if until is not None and until > self.now and (not times or times[0] > until):
+            self.now = until
+        return n
+
+    # drop every pending event, the clock keeps its time
+    def clear(self) -> None:
+        self.times.clear()
+        self.buckets.clear()
+        self.pending = 0
+
+
+# iBGP propagation with timed message delivery
+# instead of queueing an update for the next Propagator.run, every message is
+# an event delivered after the session delay between advertiser and client;
+# a message whose session has no path is lost
+class TimedPropagator(bgp.Propagator):
+    def __init__(self, routers: dict, scheduler: Scheduler, delay, max_messages=None, changed=None):
+        super().__init__(routers, max_messages)
+        self.scheduler = scheduler
+        # delay(sender, receiver) of a session, None when they cannot talk
+        self.delay = delay
+        # called without arguments after a delivered message updated routers
+        self.changed = changed
+        # time of the last message that changed a router's routes
+        self.converged_at = scheduler.now
+        # messages delivered and lost over all runs
+        self.delivered = 0
+        self.lost = 0
+
+    def advertise(self, clients, ad: dict) -> None:
+        for c in clients:
+            self.send(ad['advertiser'], c, self.deliver_ad, ad)
+
+    def withdraw(self, clients, gate, advertiser) -> None:
+        for c in clients:
+            self.send(advertiser, c, self.deliver_withdrawal, gate, advertiser)
+
+    def send(self, sender, receiver, fn, *args) -> None:
+        delay = self.delay(sender, receiver)
+        if delay is None:
+            self.lost += 1
+        else:
+            self.scheduler.schedule(delay, fn, receiver, *args)
+
+    def deliver_ad(self, receiver, ad: dict) -> None:
+        bgp.Propagator.advertise(self, [receiver], ad)
+        self.process()
+
+    def deliver_withdrawal(self, receiver, gate, advertiser) -> None:
+        bgp.Propagator.withdraw(self, [receiver], gate, advertiser)
+        self.process()
+
+    # the update is handled by the untimed work-list, whose replies go
+    # through advertise and withdraw above and so become new events
+    def process(self) -> None:
+        self.delivered += 1
+        if self.run():
+            self.converged_at = self.scheduler.now
+            if self.changed is not None:
+                self.changed()
+
+
+# send a packet through the network hop by hop as events, each hop is run
+# at the time the packet arrives, so it sees the routing tables of that time
+# done(packet, time) is called once the packet is terminated, the packet then
+# goes back to the pool it came from, if any
+def send_packet(simulator, packet, at=None, done=None, pool=None) -> None:
+    clock = simulator.clock
+    clock.at(clock.now if at is None else at, hop, simulator, packet, packet.get_sender(), done, pool)
+
+
+def hop(simulator, packet, router_id, done, pool) -> None:
+    next_hop = simulator.routers[router_id].forward(packet)
+    if next_hop is not None and next_hop not in simulator.routers:
+        packet.terminate_packet()
+        packet.outcome = fw.Outcome.UNREACHABLE
+        next_hop = None
+    if next_hop is None:
+        if done is not None:
+            done(packet, simulator.clock.now)
+        if pool is not None:
+            pool.release(packet)
+        return
+    simulator.clock.schedule(simulator.engine.graph.get_delay(router_id, next_hop),
+                             hop, simulator, packet, next_hop, done, pool)
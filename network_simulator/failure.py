@@ -0,0 +1,100 @@
+from itertools import combinations
+from multiprocessing import get_context
+from typing import NamedTuple
+import network_simulator.forwarding as fw
+import network_simulator.verify as v
+
+
+# impact of one failure scenario
+class Failure(NamedTuple):
+    # links taken down together
+    links: tuple
+    # (src, dst) router pairs reachable before the failure and not after
+    lost: list
+    # next hops that changed, {(router, dst): (old, new)} like update_link_cost
+    changed: dict
+
+
+# every link of the graph once, in CSR order
+def links_of(graph) -> list:
+    index = graph.get_csr().index
+    return [(a, b) for a in graph.map for b in graph.map[a] if index[a] < index[b]]
+
+
+# N-k scenarios: every combination of k of the given links, all links by default
+def link_combinations(graph, k, links=None) -> list:
+    return list(combinations(links_of(graph) if links is None else links, k))
+
+
+# baseline of a sweep: a fork of the simulator with every routing table
+# loaded, so the scenario forks share them, and its reachability matrix
+# every scenario runs on a fresh fork of the baseline, where only the
+# shortest path trees running through a failed link are repaired
+class Sweep:
+    def __init__(self, simulator):
+        self.simulator = simulator.fork()
+        # trees are recomputed in the process running the scenario
+        self.simulator.engine.pool = None
+        for router in self.simulator.routers.values():
+            router.routing_table
+        self.baseline = v.verify_all(self.simulator)
+
+    def run(self, links) -> Failure:
+        links = tuple(links)
+        s = self.simulator.fork()
+        # links fail one at a time, each repairing the trees running through it
+        changed = {}
+        for a, b in links:
+            for key, (old, new) in s.update_link_cost(a, b, 0).items():
+                if key in changed:
+                    old = changed.pop(key)[0]
+                if old != new:
+                    changed[key] = (old, new)
+        # only the destinations whose forwarding changed can lose sources,
+        # plus those of static routes at the end of a failed link, which
+        # keep their next hop when the link goes
+        dsts = {dst for _, dst in changed}
+        ends = {end for link in links for end in link}
+        for router_id in ends:
+            router = s.routers[router_id]
+            for dst in router.static_route:
+                if router.routing_table.get(dst) in ends:
+                    dsts.add(dst)
+        before = self.baseline
+        dsts = [dst for dst in before.dsts if dst in dsts]
+        lost = []
+        if dsts:
+            after = v.verify_all(s, dsts)
+            for j, dst in enumerate(dsts):
+                was = before.outcome[before.cols[dst]::len(before.dsts)]
+                now = after.outcome[j::len(dsts)]
+                lost.extend((src, dst) for src, b, a in zip(before.ids, was, now)
+                            if b == fw.Outcome.DELIVERED and a != fw.Outcome.DELIVERED)
+        return Failure(links, lost, changed)
+
+
+# run the failure scenarios against the current state of the simulator, a
+# scenario being a list of links failing together, every single link (N-1)
+# by default; with workers > 1 the scenarios are spread over a process
+# pool, each worker starting from its own copy of the baseline
+def sweep(simulator, scenarios=None, workers=None) -> list:
+    base = Sweep(simulator)
+    if scenarios is None:
+        scenarios = [(link,) for link in links_of(base.simulator.engine.graph)]
+    if workers is None or workers <= 1 or len(scenarios) <= 1:
+        return [base.run(links) for links in scenarios]
+    with get_context().Pool(workers, initializer=adopt, initargs=(base,)) as pool:
+        return pool.map(run, scenarios, chunksize=max(1, len(scenarios) // (workers * 4)))
+
+
+# sweep baseline of a worker process, set once by adopt
+current = None
+
+
+def adopt(base: Sweep) -> None:
+    global current
+    current = base
+
+
+def run(links) -> Failure:
+    return current.run(links)
@@ -0,0 +1,192 @@
+import enum
+from array import array
+from typing import NamedTuple
+from zlib import crc32
+import network_simulator.packet as p
+
+# markers stored in the next hop matrix next to real router indices
+NO_ROUTE = -1   # the router has no entry for the destination
+EXIT = -2       # the entry is None, the packet leaves the AS here
+# entries from GROUP down stand for equal-cost next hop sets, entry
+# GROUP - k being set k of NextHopMatrix.groups
+GROUP = -3
+
+
+# deterministic hash of a flow, the same in every run unlike hash() of a str
+def flow_hash(sender, receiver, flow=0) -> int:
+    return crc32(repr((sender, receiver, flow)).encode())
+
+
+# per router salt mixed into the flow hash, so that routers along a path do
+# not all pick the same position among their next hops
+def router_salt(router_id) -> int:
+    return crc32(repr(router_id).encode())
+
+
+# position among n equal-cost next hops of a flow at a router, taken from
+# the high bits of a multiplicative hash of the salted flow hash
+def choose(hash, salt, n) -> int:
+    return (((hash ^ salt) * 2654435761 & 0xFFFFFFFF) >> 16) % n
+
+
+# final state of a forwarded packet
+class Outcome(enum.IntEnum):
+    DELIVERED = 0
+    DENIED = 1
+    LOOP = 2
+    UNREACHABLE = 3
+    EXITED = 4
+
+
+# per hop events passed to a tracer next to the terminal Outcome values
+ARRIVE = 'arrive'
+FORWARD = 'forward'
+
+
+# result of sending a single packet
+class ForwardingResult(NamedTuple):
+    outcome: Outcome
+    path: list
+    ttl: int
+    # router whose ACL dropped the packet, None unless the outcome is DENIED
+    denied_by: object = None
+
+
+# answer of the reachability checker
+class Reachability(NamedTuple):
+    reachable: bool
+    # routers the traffic goes through, up to where it stops
+    path: list
+    # router where the traffic stops and why (an Outcome), None when reachable
+    blocked_at: object = None
+    reason: Outcome = None
+
+
+# tracer printing the messages route and route_packet have always printed
+# a tracer is any callable taking (event, router_id, packet, next_hop)
+def print_tracer(event, router_id, packet, next_hop) -> None:
+    if event == ARRIVE:
+        print("########## Packet at router", router_id, "##########")
+    elif event == FORWARD:
+        print("Next hop:", next_hop)
+    else:
+        print(MESSAGES[event])
+
+
+MESSAGES = {
+    Outcome.DELIVERED: "Destination reached",
+    Outcome.DENIED: "Packet denied",
+    Outcome.LOOP: "Forwarding loop detected",
+    Outcome.UNREACHABLE: "Destination not reachable",
+    Outcome.EXITED: "Intra-AS -> Inter-AS",
+}
+
+
+# dense next hop matrix built from the routing table of every router
+# rows are routers, columns every destination found in any routing table,
+# entry [r, d] is the row of the next hop or one of the markers above; with
+# ECMP, an entry with several next hops refers to a set of rows in groups
+class NextHopMatrix:
+    def __init__(self, routers: dict):
+        self.routers = list(routers.values())
+        self.ids = list(routers.keys())
+        self.rows = {router_id: i for i, router_id in enumerate(self.ids)}
+        self.salts = [router.salt for router in self.routers]
+        self.cols = {}
+        for router in self.routers:
+            for dst in router.routing_table:
+                if dst not in self.cols:
+                    self.cols[dst] = len(self.cols)
+        width = len(self.cols)
+        self.hops = array('i', [NO_ROUTE]) * (len(self.ids) * width)
+        # equal-cost next hop sets as tuples of rows, each stored once
+        self.groups = []
+        group_of = {}
+        for i, router in enumerate(self.routers):
+            base = i * width
+            ecmp = router.engine.ecmp
+            for dst, nh in router.routing_table.items():
+                if nh is None:
+                    self.hops[base + self.cols[dst]] = EXIT
+                    continue
+                hops = router.multipath(dst, nh) if ecmp else None
+                if hops is None or len(hops) == 1:
+                    self.hops[base + self.cols[dst]] = self.rows.get(nh, NO_ROUTE)
+                    continue
+                group = group_of.get(hops)
+                if group is None:
+                    group = group_of[hops] = GROUP - len(self.groups)
+                    self.groups.append(tuple(self.rows.get(h, NO_ROUTE) for h in hops))
+                self.hops[base + self.cols[dst]] = group
+
+    def next_hop(self, row, col) -> int:
+        return self.hops[row * len(self.cols) + col]
+
+
+# per flow results of forward_flows, every array is aligned with the input
+class FlowResults:
+    def __init__(self, outcome, hops, paths):
+        self.outcome = outcome
+        self.hops = hops
+        self.paths = paths
+
+    def __len__(self) -> int:
+        return len(self.outcome)
+
+
+# forward many (sender, receiver) flows at once against a next hop matrix
+# each hop follows Middlebox.route: ACL check, stamp, delivery, TTL decrement,
+# then the table lookup. Flows sharing a (sender, receiver) pair, and flow
+# label when flows gives one per flow, take the same path, so each distinct
+# flow is walked once and its result copied
+def forward_flows(matrix: NextHopMatrix, senders, receivers, ttl=p.DEFAULT_TTL,
+                  record_paths=False, flows=None) -> FlowResults:
+    n = len(senders)
+    outcome = array('b', [0]) * n
+    hops = array('i', [0]) * n
+    paths = [None] * n if record_paths else None
+    walked = {}
+    for f in range(n):
+        pair = (senders[f], receivers[f], 0 if flows is None else flows[f])
+        result = walked.get(pair)
+        if result is None:
+            result = walked[pair] = walk(matrix, pair[0], pair[1], ttl, pair[2])
+        outcome[f] = result[0]
+        hops[f] = result[1]
+        if record_paths:
+            paths[f] = result[2]
+    return FlowResults(outcome, hops, paths)
+
+
+# forward a single flow, returns its outcome, hop count and path
+def walk(matrix: NextHopMatrix, sender, receiver, ttl, flow=0) -> tuple:
+    row = matrix.rows[sender]
+    col = matrix.cols.get(receiver)
+    width = len(matrix.cols)
+    routers, ids, table = matrix.routers, matrix.ids, matrix.hops
+    path = []
+    hops = 0
+    hash = None
+    while True:
+        if not routers[row].check_acl(sender, receiver):
+            return Outcome.DENIED, hops, tuple(path)
+        path.append(ids[row])
+        if ids[row] == receiver:
+            return Outcome.DELIVERED, hops, tuple(path)
+        ttl -= 1
+        nh = NO_ROUTE if col is None else table[row * width + col]
+        if nh == NO_ROUTE:
+            return Outcome.UNREACHABLE, hops, tuple(path)
+        if ttl <= 0:
+            return Outcome.LOOP, hops, tuple(path)
+        if nh == EXIT:
+            return Outcome.EXITED, hops, tuple(path)
+        if nh <= GROUP:
+            if hash is None:
+                hash = flow_hash(sender, receiver, flow)
+            group = matrix.groups[GROUP - nh]
+            nh = group[choose(hash, matrix.salts[row], len(group))]
+            if nh == NO_ROUTE:
+                return Outcome.UNREACHABLE, hops, tuple(path)
+        row = nh
+        hops += 1
@@ -1,67 +1,409 @@
+from array import array
+from copy import copy
+from heapq import heappush, heappop
+from itertools import count
+
+INF = float("inf")
+
+# topology versions are drawn from one counter, so two graphs, a graph and
+# its forks included, never share a version number for different topologies
+VERSIONS = count()
+
+# propagation delay of a link without a delay attribute
+DEFAULT_DELAY = 1
+
+
+# compact adjacency of a graph in compressed sparse row form
+# router IDs are mapped to dense indices following the order of the map keys,
+# the neighbors of node i are neighbors[offsets[i]:offsets[i + 1]]
+class CSR:
+    def __init__(self, nodes_map) -> None:
+        self.nodes = list(nodes_map.keys())
+        self.index = {n: i for i, n in enumerate(self.nodes)}
+        self.offsets = array('i', [0])
+        self.neighbors = array('i')
+        self.weights = array('d')
+        # whether every link weight is an integer, used to report costs as int
+        self.integral = True
+        for n in self.nodes:
+            for nb, cost in nodes_map[n].items():
+                self.neighbors.append(self.index[nb])
+                self.weights.append(cost)
+                self.integral = self.integral and isinstance(cost, int)
+            self.offsets.append(len(self.neighbors))
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    # position of the link i -> j in the neighbor array, -1 if absent
+    def find(self, i, j) -> int:
+        for k in range(self.offsets[i], self.offsets[i + 1]):
+            if self.neighbors[k] == j:
+                return k
+        return -1
+
+
+# CSR of the links between nodes, a link being the node indices
+# ends[2k], ends[2k + 1] and its cost costs[k]; every link is given once
+# and appears in the rows of both ends, in link order
+def csr_from_links(nodes, index, ends, costs) -> CSR:
+    csr = CSR({})
+    csr.nodes = nodes
+    csr.index = index
+    n = len(nodes)
+    degree = array('i', [0]) * (n + 1)
+    for i in ends:
+        degree[i + 1] += 1
+    for i in range(n):
+        degree[i + 1] += degree[i]
+    csr.offsets = degree
+    free = array('i', degree[:n])
+    csr.neighbors = array('i', [0]) * len(ends)
+    csr.weights = array('d', [0.0]) * len(ends)
+    for k, cost in enumerate(costs):
+        i, j = ends[2 * k], ends[2 * k + 1]
+        csr.neighbors[free[i]] = j
+        csr.weights[free[i]] = cost
+        free[i] += 1
+        csr.neighbors[free[j]] = i
+        csr.weights[free[j]] = cost
+        free[j] += 1
+    for i in range(n):
+        row = csr.neighbors[degree[i]:degree[i + 1]]
+        if i in row or len(set(row)) != len(row):
+            raise ValueError("links of %s are listed more than once" % (nodes[i],))
+    return csr
+
+
+# result of a single-source run, every array is indexed by CSR index
+# pred and first hold -1 for the source and for unreachable nodes
+class ShortestPathTree:
+    __slots__ = ('source', 'dist', 'pred', 'first')
+
+    def __init__(self, source, dist, pred, first) -> None:
+        self.source = source
+        self.dist = dist
+        self.pred = pred
+        self.first = first
+
+    def copy(self) -> 'ShortestPathTree':
+        return ShortestPathTree(self.source, array('d', self.dist), array('i', self.pred), array('i', self.first))
+
+
+# a link of nodes_map is given either as its cost or as a dictionary of
+# attributes, {'cost': 1, 'delay': 0.5}; attributes are split off the map
+# so that the map only holds costs, the map returned is always a new one
+def split_attributes(nodes_map):
+    if not any(isinstance(v, dict) for nbs in nodes_map.values() for v in nbs.values()):
+        return {n: dict(nbs) for n, nbs in nodes_map.items()}, {}
+    costs = {}
+    delays = {}
+    for n, nbs in nodes_map.items():
+        costs[n] = {}
+        for nb, v in nbs.items():
+            if isinstance(v, dict):
+                costs[n][nb] = v.get('cost', 1)
+                if 'delay' in v:
+                    delays[(n, nb)] = v['delay']
+            else:
+                costs[n][nb] = v
+    return costs, delays
+
+
+# immutable view of a topology version
+# it shares the adjacency arrays of the graph, which copies them before
+# its next change (copy-on-write), so taking a snapshot costs O(1)
+class Snapshot:
+    def __init__(self, version, csr: CSR, weights, delays) -> None:
+        self.version = version
+        self.nodes = csr.nodes
+        self.index = csr.index
+        self.offsets = csr.offsets
+        self.neighbors = csr.neighbors
+        self.weights = weights
+        self.delays = delays
+        self.integral = csr.integral
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    # neighbors of a node and the cost of each link
+    def get_links(self, n) -> dict:
+        i = self.index[n]
+        weights = self.weights
+        return {self.nodes[self.neighbors[k]]: int(weights[k]) if self.integral else weights[k]
+                for k in range(self.offsets[i], self.offsets[i + 1])
+                if weights[k] != INF}
+
+    def get_cost(self, n1, n2):
+        return self.get_links(n1).get(n2, INF)
+
+    def has_link(self, n1, n2) -> bool:
+        return n2 in self.get_links(n1)
+
+    def get_delay(self, n1, n2):
+        return self.delays.get((n1, n2), DEFAULT_DELAY)
+
+    # the topology in the nodes_map format
+    def get_map(self) -> dict:
+        return {n: self.get_links(n) for n in self.nodes}
+
+
+# single-source shortest paths from CSR index s over any indexable
+# offsets/neighbors/weights (arrays or shared memory views)
+# returns the dist, pred and first hop lists, see ShortestPathTree
+# ties are broken on the CSR index, which visits nodes in the same order
+# as a linear scan over the map keys would
+def sssp(offsets, neighbors, weights, n, s) -> tuple:
+    dist = [INF] * n
+    pred = [-1] * n
+    first = [-1] * n
+    visited = [False] * n
+    dist[s] = 0
+    heap = [(0, s)]
+    while heap:
+        d, u = heappop(heap)
+        if visited[u]:
+            continue
+        visited[u] = True
+        # the first hop is inherited from the predecessor while relaxing,
+        # so no walk back to the source is needed afterwards
+        fu = first[u]
+        for k in range(offsets[u], offsets[u + 1]):
+            v = neighbors[k]
+            if visited[v]:
+                continue
+            nd = d + weights[k]
+            if nd < dist[v]:
+                dist[v] = nd
+                pred[v] = u
+                first[v] = v if u == s else fu
+                heappush(heap, (nd, v))
+    return dist, pred, first
+
+
+# topology shared by every router of a simulator
+# the map is copied from nodes_map, so changing a link never touches the
+# caller's dictionary; every change starts a new version, routers remember
+# the version of their routing table
 class Graph:
     def __init__(self, nodes_map) -> None:
         self.nb_nodes = len(nodes_map.keys())
-        self.table = None
-        self.map = nodes_map
+        self.map, self.delays = split_attributes(nodes_map)
+        # compact adjacency, rebuilt lazily after the map changes
+        self.csr = None
+        # shortest path tree of the last dijkstra run
+        self.tree = None
+        self.version = next(VERSIONS)
+        # snapshot of the current version, while it exists the weights and
+        # delays it refers to are copied before they change
+        self.current = None
+        # whether a fork shares the map, weights and delays, see fork
+        self.shared = False
+        # rows of the map the graph copied since its last fork, None when
+        # the graph owns the whole map
+        self.owned = None
 
-    def dijkstra(self, source) -> dict:
-        visited = 0
+    # links of every node as {n: {neighbor: cost}}; a graph built from_csr
+    # gets it from the CSR on first use
+    @property
+    def map(self) -> dict:
+        if self._map is None:
+            csr = self.csr
+            weights = csr.weights
+            self._map = {n: {csr.nodes[csr.neighbors[k]]: int(weights[k]) if csr.integral else weights[k]
+                             for k in range(csr.offsets[i], csr.offsets[i + 1])
+                             if weights[k] != INF}
+                         for i, n in enumerate(csr.nodes)}
+        return self._map
+
+    @map.setter
+    def map(self, nodes_map) -> None:
+        self._map = nodes_map
+
+    def get_csr(self) -> CSR:
+        if self.csr is None:
+            self.csr = CSR(self.map)
+        return self.csr
+
+    # immutable view of the current version, the same object until the next change
+    def snapshot(self) -> Snapshot:
+        if self.current is None:
+            csr = self.get_csr()
+            self.current = Snapshot(self.version, csr, csr.weights, self.delays)
+        return self.current
+
+    # copy of the graph sharing all of its state, each side copies what it
+    # changes on its first change: the map row by row, the weights and the
+    # delays at once; forking and dropping a fork touch none of the links
+    def fork(self) -> 'Graph':
+        other = copy(self)
+        if self.csr is not None:
+            other.csr = copy(self.csr)
+        other.tree = None
+        self.shared = other.shared = True
+        return other
+
+    # start a new version, copying what the last snapshot or a fork still refers to
+    def changed(self) -> None:
+        self.version = next(VERSIONS)
+        if self.shared:
+            self.map = dict(self.map)
+            self.owned = set()
+            if self.csr is not None:
+                self.csr = copy(self.csr)
+                self.csr.weights = array('d', self.csr.weights)
+            self.delays = dict(self.delays)
+            self.shared = False
+        if self.current is not None:
+            if self.csr is not None and self.csr.weights is self.current.weights:
+                self.csr.weights = array('d', self.csr.weights)
+            if self.delays is self.current.delays:
+                self.delays = dict(self.delays)
+            self.current = None
+
+    # binary-heap dijkstra over the CSR adjacency
+    def shortest_path_tree(self, source) -> ShortestPathTree:
+        csr = self.get_csr()
+        s = csr.index[source]
+        dist, pred, first = sssp(csr.offsets, csr.neighbors, csr.weights, len(csr), s)
+        return ShortestPathTree(s, array('d', dist), array('i', pred), array('i', first))
+
+    # convert the first hops of a tree into a routing dictionary
+    # unreachable destinations are left out of the table
+    def routing_from_tree(self, tree: ShortestPathTree) -> dict:
+        nodes = self.get_csr().nodes
         routing = {}
-        table = {i: {'dist': float("inf"), 'pred': None, 'visited': False}
-                for i in self.map.keys()}
-        table[source]['dist'] = 0
-        while visited < self.nb_nodes:
-            # obtain the node with the least total distance
-            min_node = None
-            min_cost = float("inf")
-            for i in table.keys():
-                if table[i]['dist'] < min_cost and not table[i]['visited']:
-                    min_node = i
-                    min_cost = table[i]['dist']
-            # explore neighbors through links
-            for n in self.map[min_node].keys():
-                if not table[n]['visited']:
-                    dist = self.map[min_node][n] + min_cost
-                    if dist < table[n]['dist']:
-                        table[n]['dist'] = dist
-                        table[n]['pred'] = min_node
-            visited += 1
-            table[min_node]['visited'] = True
-        # construct the routing table, given the dijkstra table
-        self.table = table
-        # do we need another field to specify whether the route is static or dynamic?
-        routing = {dst: self.get_next_hop(table, source, dst) for dst in self.map.keys()}
+        for i, f in enumerate(tree.first):
+            if f >= 0:
+                routing[nodes[i]] = nodes[f]
+            elif i == tree.source:
+                routing[nodes[i]] = None
         return routing
 
+    # every equal-cost first hop of a tree as {dst: next hops}, the next hops
+    # being a tuple in CSR order that equal sets share; a node inherits the
+    # first hops of each neighbor lying on one of its shortest paths, so
+    # the nodes are visited by increasing distance
+    def multipath_from_tree(self, tree: ShortestPathTree) -> dict:
+        csr = self.get_csr()
+        nodes, offsets, neighbors, weights = csr.nodes, csr.offsets, csr.neighbors, csr.weights
+        dist, s = tree.dist, tree.source
+        hops = [None] * len(nodes)
+        hops[s] = ()
+        interned = {}
+        table = {nodes[s]: (None,)}
+        for v in sorted((v for v in range(len(nodes)) if dist[v] != INF and v != s), key=dist.__getitem__):
+            found = set()
+            d = dist[v]
+            for k in range(offsets[v], offsets[v + 1]):
+                u = neighbors[k]
+                if dist[u] + weights[k] == d:
+                    if u == s:
+                        found.add(v)
+                    else:
+                        found.update(hops[u])
+            key = tuple(sorted(found))
+            hops[v] = interned.setdefault(key, key)
+            table[nodes[v]] = hops[v]
+        # the same sets as router ids
+        named = {key: tuple(nodes[i] for i in key) for key in interned}
+        for dst, key in table.items():
+            if key in named:
+                table[dst] = named[key]
+        return table
+
+    def dijkstra(self, source) -> dict:
+        self.tree = self.shortest_path_tree(source)
+        return self.routing_from_tree(self.tree)
+
+    # legacy dijkstra table of the last run
+    @property
+    def table(self) -> dict:
+        if self.tree is None:
+            return None
+        csr = self.get_csr()
+        nodes = csr.nodes
+        return {nodes[i]: {'dist': self.cost_from_tree(self.tree, i),
+                           'pred': nodes[p] if p >= 0 else None,
+                           'visited': self.tree.dist[i] != INF}
+                for i, p in enumerate(self.tree.pred)}
+
     def get_next_hop(self, table, source, dst):
         if table[dst]["pred"] == source:
             return dst
         elif dst == source:
             return None
         return self.get_next_hop(table, source, table[dst]['pred'])
-    
+
+    def cost_from_tree(self, tree: ShortestPathTree, i):
+        d = tree.dist[i]
+        if d != INF and self.get_csr().integral:
+            return int(d)
+        return d
+
     def get_cost(self, dest) -> int:
-        return self.table[dest]['dist']
+        return self.cost_from_tree(self.tree, self.get_csr().index[dest])
+
+    # propagation delay from n1 to n2
+    def get_delay(self, n1, n2):
+        return self.delays.get((n1, n2), DEFAULT_DELAY)
+
+    def set_delay(self, n1, n2, delay) -> None:
+        self.changed()
+        self.delays[(n1, n2)] = delay
+        self.delays[(n2, n1)] = delay
+
+    # links of n to change, the row is copied first if a fork still shares it
+    def row(self, n) -> dict:
+        if self.owned is not None and n not in self.owned:
+            self.map[n] = dict(self.map[n])
+            self.owned.add(n)
+        return self.map[n]
 
     def has_link(self, n1, n2) -> bool:
         return n1 in self.map[n2].keys() and n2 in self.map[n1].keys()
 
     def create_link(self, n1, n2, cost=1) -> None:
         if n2 not in self.map[n1].keys() and n1 not in self.map[n2].keys():
-            self.map[n1][n2] = cost
-            self.map[n2][n1] = cost
+            self.changed()
+            self.row(n1)[n2] = cost
+            self.row(n2)[n1] = cost
+            # reuse the slot of a destroyed link if the adjacency still has it
+            if not self.patch_weight(n1, n2, cost):
+                self.csr = None
 
     def update_cost(self, n1, n2, cost) -> None:
         if n2 in self.map[n1].keys() and n1 in self.map[n2].keys():
-            self.map[n1][n2] = cost
-            self.map[n2][n1] = cost
+            self.changed()
+            self.row(n1)[n2] = cost
+            self.row(n2)[n1] = cost
+            self.patch_weight(n1, n2, cost)
         else:
             self.create_link(n1, n2, cost)
 
     def destroy_link(self, n1, n2) -> None:
         if n2 in self.map[n1].keys() and n1 in self.map[n2].keys():
-            del self.map[n1][n2]
-            del self.map[n2][n1]
+            self.changed()
+            del self.row(n1)[n2]
+            del self.row(n2)[n1]
+            # an infinite weight disables the link without rebuilding the adjacency
+            self.patch_weight(n1, n2, INF)
+
+    # rewrite a link weight in place instead of rebuilding the adjacency
+    # returns False when the adjacency has no slot for the link
+    def patch_weight(self, n1, n2, cost) -> bool:
+        if self.csr is None:
+            return True
+        i, j = self.csr.index[n1], self.csr.index[n2]
+        k1, k2 = self.csr.find(i, j), self.csr.find(j, i)
+        if k1 < 0 or k2 < 0:
+            return False
+        self.csr.weights[k1] = cost
+        self.csr.weights[k2] = cost
+        if cost != INF:
+            self.csr.integral = self.csr.integral and isinstance(cost, int)
+        return True
 
     def get_map(self) -> dict:
         return self.map.copy()
@@ -70,6 +412,17 @@ class Graph:
         return self.table.copy()
 
 
+# graph over a ready CSR adjacency, its map is only built from the CSR if
+# a change or a caller needs it, see loader
+def from_csr(csr: CSR, delays=None) -> Graph:
+    graph = Graph({})
+    graph.nb_nodes = len(csr)
+    graph.csr = csr
+    graph.map = None
+    graph.delays = {} if delays is None else delays
+    return graph
+
+
 if __name__ == '__main__':
     # creates a graph with link cost default to zero
     nodes_map = {
@@ -82,4 +435,4 @@ if __name__ == '__main__':
     }
     g = Graph(nodes_map)
     print(g.get_map())
-    print(g.dijkstra(0))
\ No newline at end of file
+    print(g.dijkstra(0))
@@ -0,0 +1,174 @@
+import csv
+import json
+from array import array
+import network_simulator.graph as g
+
+
+# streaming readers of large topologies and iBGP configurations
+# a links file lists every link once, in CSV with a header
+#   a,b,cost,delay
+# the cost and delay columns being optional (cost 1, default delay), or in
+# JSON Lines, one {"a": 0, "b": 1, "cost": 1, "delay": 0.5} per line
+# a sessions file lists every router once with its type (see
+# init_bgp_config) and the routers serving it over iBGP, in CSV
+#   router,type,servers
+# with space separated servers, or in JSON Lines,
+#   {"router": 4, "type": 1, "server": [0, 2]}
+# a server's clients are the routers listing it, in file order
+# files ending in .csv are read as CSV, any other as JSON Lines
+# both are read one line at a time; the links go into flat arrays that
+# become the CSR adjacency of the graph, no graph_config is built
+def is_csv(path) -> bool:
+    return str(path).lower().endswith('.csv')
+
+
+# router ids of a CSV file are ints whenever they parse as one
+def parse_id(text):
+    try:
+        return int(text)
+    except ValueError:
+        return text
+
+
+def parse_number(text):
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+# fields of the given columns in every row of a CSV file, None for a
+# missing column or an empty field
+def csv_rows(path, columns):
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        header = [name.strip() for name in next(reader, [])]
+        positions = [header.index(name) if name in header else None for name in columns]
+        for row in reader:
+            if row:
+                yield [row[k].strip() or None if k is not None and k < len(row) else None
+                       for k in positions]
+
+
+def json_rows(path, columns):
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                yield [record.get(name) for name in columns]
+
+
+# (a, b, cost, delay) of every link of a links file, delay None if not given
+def read_links(path):
+    if is_csv(path):
+        for a, b, cost, delay in csv_rows(path, ('a', 'b', 'cost', 'delay')):
+            yield (parse_id(a), parse_id(b), 1 if cost is None else parse_number(cost),
+                   None if delay is None else parse_number(delay))
+    else:
+        for a, b, cost, delay in json_rows(path, ('a', 'b', 'cost', 'delay')):
+            yield a, b, 1 if cost is None else cost, delay
+
+
+# (router, type, servers) of every router of a sessions file
+def read_sessions(path):
+    if is_csv(path):
+        for router, router_type, servers in csv_rows(path, ('router', 'type', 'servers')):
+            yield (parse_id(router), int(router_type),
+                   [parse_id(s) for s in servers.split()] if servers else [])
+    else:
+        for router, router_type, servers in json_rows(path, ('router', 'type', 'server')):
+            yield router, router_type, servers or []
+
+
+# graph of the links of a links file; nodes fixes the CSR order of the
+# routers it lists, the others follow in order of first appearance
+def load_graph(path, nodes=()) -> g.Graph:
+    nodes = list(nodes)
+    index = {n: i for i, n in enumerate(nodes)}
+    ends = array('i')
+    costs = array('d')
+    integral = True
+    delays = {}
+    for a, b, cost, delay in read_links(path):
+        for n in (a, b):
+            if n not in index:
+                index[n] = len(nodes)
+                nodes.append(n)
+        ends.append(index[a])
+        ends.append(index[b])
+        costs.append(cost)
+        integral = integral and isinstance(cost, int)
+        if delay is not None:
+            delays[(a, b)] = delays[(b, a)] = delay
+    csr = g.csr_from_links(nodes, index, ends, costs)
+    csr.integral = integral
+    return g.from_csr(csr, delays)
+
+
+# router types and iBGP sessions of a sessions file, see load
+class Sessions:
+    def __init__(self, path):
+        self.ids = []
+        self.types = array('b')
+        # servers of every router, aligned with ids
+        self.servers = []
+        for router, router_type, servers in read_sessions(path):
+            self.ids.append(router)
+            self.types.append(router_type)
+            self.servers.append(tuple(servers))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    # (router, type) of every router, in file order
+    def routers(self):
+        return zip(self.ids, self.types)
+
+    # open the sessions on the routers, like start_iBGP_session with the
+    # matching ibgp_config on every router
+    def start(self, routers: dict) -> None:
+        clients = {}
+        for router, servers in zip(self.ids, self.servers):
+            for server in servers:
+                clients.setdefault(server, []).append(router)
+        for router, servers in zip(self.ids, self.servers):
+            routers[router].start_iBGP_session(
+                {router: {'server': list(servers), 'client': clients.get(router, [])}})
+
+
+# write a graph_config as a links file, every link once
+def write_links(path, graph_config: dict) -> None:
+    order = {n: i for i, n in enumerate(graph_config)}
+    links = ((a, b, v) for a in graph_config for b, v in graph_config[a].items()
+             if order[a] < order[b])
+    with open(path, 'w', newline='') as f:
+        if is_csv(path):
+            writer = csv.writer(f)
+            writer.writerow(('a', 'b', 'cost', 'delay'))
+            for a, b, v in links:
+                if isinstance(v, dict):
+                    writer.writerow((a, b, v.get('cost', 1), v.get('delay', '')))
+                else:
+                    writer.writerow((a, b, v, ''))
+        else:
+            for a, b, v in links:
+                record = {'a': a, 'b': b}
+                if isinstance(v, dict):
+                    record.update(v)
+                else:
+                    record['cost'] = v
+                f.write(json.dumps(record) + '\n')
+
+
+# write an ibgp_config as a sessions file
+def write_sessions(path, ibgp_config: dict) -> None:
+    with open(path, 'w', newline='') as f:
+        if is_csv(path):
+            writer = csv.writer(f)
+            writer.writerow(('router', 'type', 'servers'))
+            for router, config in ibgp_config.items():
+                writer.writerow((router, config['type'], ' '.join(map(str, config['server']))))
+        else:
+            for router, config in ibgp_config.items():
+                f.write(json.dumps({'router': router, 'type': config['type'],
+                                    'server': config['server']}) + '\n')
@@ -1,10 +1,53 @@
+# hops a packet may take before it is considered caught in a loop
+DEFAULT_TTL = 16
+
+# path recording modes, a positive path_limit keeps only the last hops
+PATH_FULL = None
+PATH_OFF = 0
+
 class Packet:
-    def __init__(self, sender, receiver):
+    # no per-instance dictionary, millions of packets may be alive at once
+    __slots__ = ('sender', 'receiver', 'status', 'TTL', 'limit', 'path', 'hops', 'outcome',
+                 'flow', 'flow_hash')
+
+    # path_limit selects how the path is recorded: PATH_FULL keeps every hop,
+    # PATH_OFF none, a positive number the last path_limit hops in a ring
+    # flow tells apart packets of the same sender and receiver under ECMP
+    def __init__(self, sender, receiver, path_limit=PATH_FULL, flow=0):
         self.sender = sender
         self.receiver = receiver
+        self.flow = flow
+        # forwarding.flow_hash of the packet, set by the first ECMP choice
+        self.flow_hash = None
         self.status = False
-        self.TTL = 16
-        self.path = []
+        self.TTL = DEFAULT_TTL
+        self.limit = path_limit
+        # a list, None when recording is off, or a ring of path_limit
+        # slots that hop number k writes at k % path_limit
+        if path_limit is PATH_FULL:
+            self.path = []
+        elif path_limit == PATH_OFF:
+            self.path = None
+        else:
+            self.path = [None] * path_limit
+        # routers visited, counted in every recording mode
+        self.hops = 0
+        # forwarding.Outcome set when the packet is terminated
+        self.outcome = None
+
+    # make the packet new again for another sender and receiver, keeping its
+    # recording mode, used by PacketPool
+    def reset(self, sender, receiver, flow=0) -> None:
+        self.sender = sender
+        self.receiver = receiver
+        self.flow = flow
+        self.flow_hash = None
+        self.status = False
+        self.TTL = DEFAULT_TTL
+        if self.limit is PATH_FULL:
+            self.path.clear()
+        self.hops = 0
+        self.outcome = None
 
     def get_sender(self):
         return self.sender
@@ -13,23 +56,75 @@ class Packet:
         return self.receiver
 
     def stamp_packet(self, router):
-        self.path.append(router)
+        if self.limit is PATH_FULL:
+            self.path.append(router)
+        elif self.limit:
+            self.path[self.hops % self.limit] = router
+        self.hops += 1
 
+    # the recorded hops in order, empty when recording is off
     def get_path(self):
-        return self.path.copy()
-    
+        if self.limit is PATH_FULL:
+            return self.path.copy()
+        if not self.limit:
+            return []
+        if self.hops <= self.limit:
+            return self.path[:self.hops]
+        k = self.hops % self.limit
+        return self.path[k:] + self.path[:k]
+
+    # last router visited, None before the first hop or without recording
+    def get_last_hop(self):
+        if not self.hops or self.limit == PATH_OFF:
+            return None
+        if self.limit is PATH_FULL:
+            return self.path[-1]
+        return self.path[(self.hops - 1) % self.limit]
+
+    def get_hops(self) -> int:
+        return self.hops
+
     def get_TTL(self):
         return self.TTL
-    
+
     def dec_TTL(self):
         self.TTL -= 1
 
     def terminate_packet(self):
         if not self.status:
             self.status = True
-            
+
     def has_terminate(self):
         return self.status
 
+    def get_outcome(self):
+        return self.outcome
+
+
+# free list of packets for the bulk send paths
+# a released packet is reset and handed out again by the next acquire
+# instead of allocating a new one; packets keep the pool's recording mode
+class PacketPool:
+    def __init__(self, path_limit=PATH_OFF):
+        self.path_limit = path_limit
+        self.free = []
+        # packets allocated by the pool
+        self.allocated = 0
+
+    def __len__(self) -> int:
+        return len(self.free)
+
+    def acquire(self, sender, receiver, flow=0) -> Packet:
+        if self.free:
+            packet = self.free.pop()
+            packet.reset(sender, receiver, flow)
+            return packet
+        self.allocated += 1
+        return Packet(sender, receiver, self.path_limit, flow)
+
+    # give a packet back, it must not be used afterwards
+    def release(self, packet: Packet) -> None:
+        self.free.append(packet)
+
 if __name__ == '__main__':
-    p = Packet(1, 2)
\ No newline at end of file
+    p = Packet(1, 2)
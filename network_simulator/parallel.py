@@ -0,0 +1,150 @@
+import weakref
+from array import array
+from multiprocessing import get_context, resource_tracker, shared_memory
+import network_simulator.graph as g
+
+# bytes of the int32 and float64 items of the shared blocks
+INT = array('i').itemsize
+FLOAT = array('d').itemsize
+
+
+# byte ranges of the CSR arrays in a shared block of n nodes and m links:
+# offsets (n + 1 ints), neighbors (m ints), then the weights (m doubles)
+# starting on a double boundary
+def csr_layout(n, m) -> list:
+    neighbors = INT * (n + 1)
+    weights = neighbors + INT * m
+    weights += -weights % FLOAT
+    return [(0, neighbors, 'i'), (neighbors, neighbors + INT * m, 'i'), (weights, weights + FLOAT * m, 'd')]
+
+
+# byte ranges of the dist, pred and first rows of rows trees over n nodes
+def tree_layout(rows, n) -> list:
+    pred = FLOAT * rows * n
+    first = pred + INT * rows * n
+    return [(0, pred, 'd'), (pred, first, 'i'), (first, first + INT * rows * n, 'i')]
+
+
+# typed views of the ranges of a shared block, release them before closing it
+def views(buf, layout) -> list:
+    return [buf[lo:hi].cast(typecode) for lo, hi, typecode in layout]
+
+
+def release(views) -> None:
+    for view in views:
+        view.release()
+
+
+# pool of worker processes computing shortest path trees
+# the topology goes to the workers once per version through a shared memory
+# block, the trees come back through another one, one row per source, so
+# nothing larger than a list of source indices is pickled
+class TreePool:
+    def __init__(self, workers: int):
+        self.workers = workers
+        # workers must share the parent's resource tracker, started before
+        # they are, otherwise each would free the blocks it attached on exit
+        resource_tracker.ensure_running()
+        self.pool = get_context().Pool(workers)
+        # shared CSR block and the topology version it holds, kept in a list
+        # so that the finalizer frees the current one
+        self.blocks = [None]
+        self.version = None
+        self.finalizer = weakref.finalize(self, TreePool.shutdown, self.pool, self.blocks)
+
+    # shared block holding the CSR of the graph's current version
+    def share(self, graph: g.Graph):
+        if self.blocks[0] is not None and self.version == graph.version:
+            return self.blocks[0]
+        self.unlink()
+        csr = graph.get_csr()
+        layout = csr_layout(len(csr), len(csr.neighbors))
+        block = self.blocks[0] = shared_memory.SharedMemory(create=True, size=max(layout[-1][1], 1))
+        for (lo, hi, _), values in zip(layout, (csr.offsets, csr.neighbors, csr.weights)):
+            block.buf[lo:hi] = values.tobytes()
+        self.version = graph.version
+        return block
+
+    # shortest path trees of the given sources, identical to the ones of
+    # Graph.shortest_path_tree, as {source: ShortestPathTree}
+    def compute(self, graph: g.Graph, sources) -> dict:
+        sources = list(sources)
+        csr = graph.get_csr()
+        n, m = len(csr), len(csr.neighbors)
+        block = self.share(graph)
+        rows = len(sources)
+        layout = tree_layout(rows, n)
+        out = shared_memory.SharedMemory(create=True, size=max(layout[-1][1], 1))
+        try:
+            # contiguous chunks of rows, a few per worker to balance the load
+            step = max(1, -(-rows // (self.workers * 4)))
+            self.pool.map(solve, [(block.name, n, m, out.name, rows, start,
+                                   [csr.index[s] for s in sources[start:start + step]])
+                                  for start in range(0, rows, step)])
+            trees = {}
+            for row, source in enumerate(sources):
+                arrays = []
+                for lo, _, typecode in layout:
+                    values = array(typecode)
+                    size = n * values.itemsize
+                    values.frombytes(out.buf[lo + row * size:lo + (row + 1) * size])
+                    arrays.append(values)
+                trees[source] = g.ShortestPathTree(csr.index[source], *arrays)
+        finally:
+            out.close()
+            out.unlink()
+        return trees
+
+    def unlink(self) -> None:
+        if self.blocks[0] is not None:
+            self.blocks[0].close()
+            self.blocks[0].unlink()
+            self.blocks[0] = None
+
+    # stop the workers and free the shared topology
+    def close(self) -> None:
+        self.finalizer()
+
+    @staticmethod
+    def shutdown(pool, blocks) -> None:
+        pool.terminate()
+        for block in blocks:
+            if block is not None:
+                block.close()
+                block.unlink()
+
+
+# shared blocks a worker has attached, by name
+attached = {}
+
+
+# open a block created by the parent, which alone is in charge of freeing it
+def attach(name) -> shared_memory.SharedMemory:
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # before Python 3.13 the block is registered again with the resource
+        # tracker shared with the parent, whose unlink unregisters it
+        return shared_memory.SharedMemory(name=name)
+
+
+# worker side: compute the trees of a chunk of sources into their rows
+def solve(task) -> int:
+    csr_name, n, m, out_name, rows, start, sources = task
+    # a new topology version replaces the block of the previous one
+    for name in [name for name in attached if name != csr_name]:
+        attached.pop(name).close()
+    block = attached.get(csr_name)
+    if block is None:
+        block = attached[csr_name] = attach(csr_name)
+    out = attach(out_name)
+    topology = views(block.buf, csr_layout(n, m))
+    shared = views(out.buf, tree_layout(rows, n))
+    for row, s in enumerate(sources, start):
+        lo, hi = row * n, (row + 1) * n
+        for view, values, typecode in zip(shared, g.sssp(*topology, n, s), 'dii'):
+            view[lo:hi] = array(typecode, values)
+    release(topology)
+    release(shared)
+    out.close()
+    return len(sources)
@@ -0,0 +1,115 @@
+# adj-RIB-in of a router: the iBGP routes it received, indexed by prefix and
+# by advertiser, with the best gateway of every prefix cached
+# a route is the gateway an advertiser announced for a prefix, each
+# advertiser holds at most one route per prefix
+class RIB:
+    def __init__(self):
+        # prefix -> {advertiser: gate}, in arrival order
+        self.by_prefix = {}
+        # advertiser -> gate -> prefixes announced through that gate, as
+        # an insertion-ordered dict of None values
+        self.by_advertiser = {}
+        # gate -> {prefix: number of routes through the gate}, the prefixes
+        # whose best path depends on the distance to the gate
+        self.by_gate = {}
+        # prefix -> gate of the chosen route
+        self.best = {}
+
+    def __contains__(self, prefix) -> bool:
+        return prefix in self.by_prefix
+
+    def __len__(self) -> int:
+        return len(self.by_prefix)
+
+    # copy sharing no index with this RIB, for a router that stops sharing it
+    def copy(self) -> 'RIB':
+        other = RIB()
+        other.by_prefix = {prefix: dict(routes) for prefix, routes in self.by_prefix.items()}
+        other.by_advertiser = {advertiser: {gate: dict(prefixes) for gate, prefixes in own.items()}
+                               for advertiser, own in self.by_advertiser.items()}
+        other.by_gate = {gate: dict(dependents) for gate, dependents in self.by_gate.items()}
+        other.best = dict(self.best)
+        return other
+
+    # routes of a prefix as {advertiser: gate}
+    def routes(self, prefix) -> dict:
+        return self.by_prefix.get(prefix, {})
+
+    def get(self, prefix, advertiser):
+        return self.by_prefix.get(prefix, {}).get(advertiser)
+
+    # whether the advertiser announced exactly this gate for the prefix
+    def has(self, prefix, gate, advertiser) -> bool:
+        routes = self.by_prefix.get(prefix)
+        return routes is not None and advertiser in routes and routes[advertiser] == gate
+
+    # store the route of an advertiser, replacing its earlier route to the prefix
+    # a replaced route moves behind the others, as if it had just arrived
+    def add(self, prefix, gate, advertiser) -> None:
+        routes = self.by_prefix.get(prefix)
+        if routes is None:
+            routes = self.by_prefix[prefix] = {}
+        elif advertiser in routes:
+            self.unindex(prefix, routes.pop(advertiser), advertiser)
+        routes[advertiser] = gate
+        own = self.by_advertiser.get(advertiser)
+        if own is None:
+            own = self.by_advertiser[advertiser] = {}
+        through = own.get(gate)
+        if through is None:
+            through = own[gate] = {}
+        through[prefix] = None
+        dependents = self.by_gate.get(gate)
+        if dependents is None:
+            dependents = self.by_gate[gate] = {}
+        dependents[prefix] = dependents.get(prefix, 0) + 1
+
+    def unindex(self, prefix, gate, advertiser) -> None:
+        own = self.by_advertiser[advertiser]
+        through = own[gate]
+        del through[prefix]
+        if not through:
+            del own[gate]
+            if not own:
+                del self.by_advertiser[advertiser]
+        self.release(prefix, gate)
+
+    def release(self, prefix, gate) -> None:
+        dependents = self.by_gate[gate]
+        if dependents[prefix] == 1:
+            del dependents[prefix]
+            if not dependents:
+                del self.by_gate[gate]
+        else:
+            dependents[prefix] -= 1
+
+    # prefixes with a route through any of the gates
+    def depending_on(self, gates) -> list:
+        prefixes = {}
+        for gate in gates:
+            prefixes.update(self.by_gate.get(gate, ()))
+        return list(prefixes)
+
+    # remove the routes an advertiser announced through the gate
+    # costs time in the number of routes removed, not in the size of the RIB
+    # returns the prefixes that lost a route
+    def withdraw(self, gate, advertiser) -> list:
+        own = self.by_advertiser.get(advertiser)
+        if own is None or gate not in own:
+            return []
+        prefixes = list(own.pop(gate))
+        if not own:
+            del self.by_advertiser[advertiser]
+        for prefix in prefixes:
+            self.release(prefix, gate)
+            routes = self.by_prefix[prefix]
+            del routes[advertiser]
+            if not routes:
+                del self.by_prefix[prefix]
+                self.best.pop(prefix, None)
+        return prefixes
+
+    # routes in the legacy Middlebox.iBGP_msg format {prefix: [[gate, advertiser]]}
+    def as_messages(self) -> dict:
+        return {prefix: [[gate, advertiser] for advertiser, gate in routes.items()]
+                for prefix, routes in self.by_prefix.items()}
@@ -1,50 +1,173 @@
 import abc
+from collections.abc import Mapping
+from copy import copy, deepcopy
+from types import MappingProxyType
+import network_simulator.acl as ac
+import network_simulator.forwarding as fw
 import network_simulator.graph as g
 import network_simulator.packet as p
+import network_simulator.rib as rb
+import network_simulator.routing as rt
+
+# read-only view of a router's routing table that follows every change,
+# including the copies made after a snapshot
+class RoutingView(Mapping):
+    def __init__(self, router):
+        self.router = router
+
+    def __getitem__(self, dst):
+        return self.router.routing_table[dst]
+
+    def __iter__(self):
+        return iter(self.router.routing_table)
+
+    def __len__(self) -> int:
+        return len(self.router.routing_table)
+
 
 # base class of all router types
 class Middlebox:
-    def __init__(self, router_id, nodes_map):
+    def __init__(self, router_id, nodes_map, engine=None):
         self.id = router_id
-        self.graph = g.Graph(nodes_map)
-        # IGP config
-        self.routing_table = None
+        # routers of a simulator share the simulator's routing engine,
+        # a standalone router gets a private one over its own graph
+        if engine is None:
+            engine = rt.RoutingEngine(g.Graph(nodes_map))
+        self.engine = engine
+        # the topology is shared, the router only keeps a reference to it
+        self.graph = engine.graph
+        # IGP config, read lazily from the routing engine on first access
+        self._routing_table = None
+        # topology version the routing table was computed for, a table that
+        # fell behind is reloaded on its next access
+        self.version = None
+        # whether a snapshot or a fork refers to the table, it is copied
+        # before the next write
+        self._routing_shared = False
+        # whether a fork shares the access list and the RIB, see fork
+        self._acl_shared = False
+        self._rib_shared = False
         # all routes are dynamic by default
         # call dynamic_to_static to switch to static mode
         self.static_route = []
         # BGP config
         self.neighbor = None
-        self.iBGP_msg = {}
+        # adj-RIB-in of the routes received over iBGP
+        self.rib = rb.RIB()
         self.iBGP = {
             'client': [],
             'server': []
         }
-        # Access-control configs stored in a list of dictionaries
-        self.acl = []   # if no match till the end of the list, then denied
-        # update routing table upon initialization
-        self.update_routing_table()
+        # Access-control configs, indexed; see acl for the list of dictionaries
+        self.access_list = ac.AccessList()
+        # mixed into the flow hash when choosing among equal-cost next hops
+        self.salt = fw.router_salt(router_id)
 
     def get_id(self):
         return self.id
 
+    # copy of the router for a forked simulator running on the given engine
+    # the routing table, access list and RIB stay shared until either
+    # router writes one of them, that router then copies it first
+    def fork(self, engine) -> 'Middlebox':
+        other = copy(self)
+        other.engine = engine
+        other.graph = engine.graph
+        other.static_route = self.static_route.copy()
+        other.iBGP = {role: routers.copy() for role, routers in self.iBGP.items()}
+        if self._routing_table is not None:
+            self._routing_shared = other._routing_shared = True
+        self._acl_shared = other._acl_shared = True
+        self._rib_shared = other._rib_shared = True
+        return other
+
+    @property
+    def routing_table(self) -> dict:
+        if self._routing_table is None or self.version != self.graph.version:
+            self.update_routing_table()
+        return self._routing_table
+
+    @routing_table.setter
+    def routing_table(self, table) -> None:
+        self._routing_table = table
+        self._routing_shared = False
+
+    # Access-control configs stored in a list of dictionaries, built from the
+    # access list on first use after a change; change them through add_acl
+    # and remove_acl only. If no match till the end of the list, then denied
+    @property
+    def acl(self) -> list:
+        return self.access_list.rules
+
+    # access list to change, copied first if a fork still shares it
+    def writable_access_list(self) -> ac.AccessList:
+        if self._acl_shared:
+            self.access_list = deepcopy(self.access_list)
+            self._acl_shared = False
+        return self.access_list
+
+    # RIB to change, copied first if a fork still shares it
+    def writable_rib(self) -> rb.RIB:
+        if self._rib_shared:
+            self.rib = self.rib.copy()
+            self._rib_shared = False
+        return self.rib
+
+    # routing table to write to, copied first if a snapshot still refers to it
+    def writable_routing_table(self) -> dict:
+        table = self.routing_table
+        if self._routing_shared:
+            table = self.routing_table = table.copy()
+        return table
+
     def update_graph(self, n1, n2, cost):
         # destroys the link when the cost is 0
-        if not cost:
-            self.graph.destroy_link(n1, n2)
-        elif self.graph.has_link(n1, n2):
-            self.graph.update_cost(n1, n2, cost)
-        self.append_routing_table()
-        self.update_routing_table()
+        # the other routers sharing the topology reload their table when
+        # they next read it
+        before = self.graph.version
+        changes = self.engine.update_link(n1, n2, cost)
+        return self.apply_routing_changes(changes.get(self.id, {}), before)
+
+    # apply next hop changes reported by the routing engine
+    # before is the topology version the changes start from, a table that
+    # was older than that is reloaded instead
+    # static routes are left untouched, returns the entries that really changed
+    # including the BGP prefixes whose best path moved
+    def apply_routing_changes(self, changes: dict, before=None) -> dict:
+        if self._routing_table is not None:
+            if before is not None and self.version != before:
+                return self.reload_routing_table()
+            self.version = self.graph.version
+        delta = {}
+        for dst, (old, new) in changes.items():
+            if old == new or dst in self.static_route:
+                continue
+            delta[dst] = (old, new)
+            # a table that was never read is loaded fresh from the engine later
+            if self._routing_table is None:
+                continue
+            if new is None:
+                self.writable_routing_table().pop(dst, None)
+            else:
+                self.writable_routing_table()[dst] = new
+        # the changes also cover destinations whose distance alone changed,
+        # which can move the best path of the prefixes behind them
+        delta.update(self.update_iBGP_routes(changes))
+        return delta
 
     def route(self, packet: p.Packet):
+        return self.forward(packet, fw.print_tracer)
+
+    # forward a packet without printing anything, returns the next hop or None
+    # once the packet is terminated, its outcome is then set on the packet
+    # the optional tracer is called with (event, router_id, packet, next_hop)
+    def forward(self, packet: p.Packet, tracer=None):
         # get the receiver of this packet
         # then track put self.id on the packet
         receiver = packet.get_receiver()
         # if the packet is not allowed by the acl
-        if not self.check_acl(packet.get_sender(), packet.get_receiver()):
-            print("Packet denied")
-            packet.terminate_packet()
-            return None
+        if not self.check_acl(packet.get_sender(), receiver):
+            return self.drop(packet, fw.Outcome.DENIED, tracer)
         packet.stamp_packet(self.get_id())
         # self is not the receipient of this packet
         if receiver != self.get_id():
@@ -52,49 +175,106 @@ class Middlebox:
             packet.dec_TTL()
         else:
             # successfully received the packet
-            packet.terminate_packet()
-            print("Destination reached")
-            return None
+            return self.drop(packet, fw.Outcome.DELIVERED, tracer)
         try:
-            next_hop = self.get_routing_table()[receiver]
-            # TTL is still valid and packet not yet terminated
-            if packet.get_TTL() > 0 and not packet.has_terminate():
-                if next_hop != None:
-                    print("Next hop:", next_hop)
-                    return next_hop
-                # packet has reached boundary router
-                print("Intra-AS -> Inter-AS")
-                packet.terminate_packet()
-                return None
-            # TTL reaches 0, packet dropped
-            elif not packet.get_TTL() and not packet.has_terminate():
-                packet.terminate_packet()
-                print("Forwarding loop detected")
-                return None
-
+            next_hop = self.routing_table[receiver]
         except KeyError:
-            packet.terminate_packet()
-            print("Destination not reachable")
-            return None
+            return self.drop(packet, fw.Outcome.UNREACHABLE, tracer)
+        if self.engine.ecmp and next_hop is not None:
+            next_hop = self.choose_next_hop(receiver, next_hop, packet)
+        # TTL is still valid and packet not yet terminated
+        if packet.get_TTL() > 0 and not packet.has_terminate():
+            if next_hop != None:
+                if tracer is not None:
+                    tracer(fw.FORWARD, self.id, packet, next_hop)
+                return next_hop
+            # packet has reached boundary router
+            return self.drop(packet, fw.Outcome.EXITED, tracer)
+        # TTL reaches 0, packet dropped
+        elif not packet.get_TTL() and not packet.has_terminate():
+            return self.drop(packet, fw.Outcome.LOOP, tracer)
+
+    # terminate a packet with the given outcome
+    def drop(self, packet: p.Packet, outcome, tracer=None) -> None:
+        packet.terminate_packet()
+        packet.outcome = outcome
+        if tracer is not None:
+            tracer(outcome, self.id, packet, None)
+        return None
+
+    # load the routing table again and return the entries that changed
+    def reload_routing_table(self) -> dict:
+        old = self._routing_table
+        self.update_routing_table()
+        new = self._routing_table
+        delta = {dst: (nh, new.get(dst)) for dst, nh in old.items() if new.get(dst, nh) != nh or dst not in new}
+        delta.update((dst, (None, nh)) for dst, nh in new.items() if dst not in old)
+        return delta
 
     def update_routing_table(self):
-        new_table = self.graph.dijkstra(self.id)
+        self.version = self.graph.version
+        new_table = self.engine.get_routing_table(self.id)
         # swap the next hop for static route with the one in the old dictionary
-        for i in self.static_route:
-            new_table[i] = self.routing_table[i]
+        if self._routing_table is not None:
+            for i in self.static_route:
+                if i in self._routing_table:
+                    new_table[i] = self._routing_table[i]
+                else:
+                    new_table.pop(i, None)
         self.routing_table = new_table
+        # the routes learned over BGP are chosen again on the new table
+        if self.rib:
+            self.opt_iBGP_routes(list(self.rib.by_prefix))
 
     def append_routing_table(self, dest, gateway) -> None:
-        self.routing_table[dest] = gateway
+        self.writable_routing_table()[dest] = gateway
 
     def remove_routing_table(self, dest) -> None:
-        del self.routing_table[dest]
+        del self.writable_routing_table()[dest]
 
     def get_routing_table(self):
         return self.routing_table.copy()
 
+    # read-only live view of the routing table, nothing is copied
+    def get_routing_view(self) -> 'RoutingView':
+        return RoutingView(self)
+
+    # read-only snapshot of the routing table
+    # the table is shared until the router changes it, then the router copies it
+    def snapshot_routing_table(self) -> MappingProxyType:
+        table = self.routing_table
+        self._routing_shared = True
+        return MappingProxyType(table)
+
     def get_next_hop(self, dst):
-        return self.get_routing_table()[dst]
+        return self.routing_table[dst]
+
+    # every equal-cost next hop towards dst as a tuple, the next hop of the
+    # routing table alone without ECMP or for static and external routes;
+    # a BGP prefix takes the next hops towards its best gateway
+    def get_next_hops(self, dst) -> tuple:
+        nh = self.routing_table[dst]
+        if not self.engine.ecmp:
+            return (nh,)
+        return self.multipath(dst, nh)
+
+    def multipath(self, dst, nh) -> tuple:
+        if nh is None or dst in self.static_route:
+            return (nh,)
+        hops = self.engine.get_next_hops(self.id).get(self.rib.best.get(dst, dst))
+        if hops is None or nh not in hops:
+            return (nh,)
+        return hops
+
+    # the next hop of a packet among the equal-cost ones, picked by its flow
+    # hash so that every packet of a flow takes the same path
+    def choose_next_hop(self, dst, nh, packet: p.Packet):
+        hops = self.multipath(dst, nh)
+        if len(hops) == 1:
+            return nh
+        if packet.flow_hash is None:
+            packet.flow_hash = fw.flow_hash(packet.sender, packet.receiver, packet.flow)
+        return hops[fw.choose(packet.flow_hash, self.salt, len(hops))]
 
     # adds a static route to the current routing table
     def add_static_route(self, dst, nh) -> bool:
@@ -105,7 +285,8 @@ class Middlebox:
                 print("No link between", self.id, nh)
                 return False
             # overwrites the existing entry (if any exists)
-            self.routing_table[dst] = nh
+            self.writable_routing_table()[dst] = nh
+            self.update_iBGP_routes([dst])
             return True
         return False
 
@@ -117,7 +298,8 @@ class Middlebox:
             return False
         # removes this route from the routing table and the static route entry
         # once a static entry is deleted, the link automatically 
-        del self.routing_table[dst]
+        del self.writable_routing_table()[dst]
+        self.update_iBGP_routes([dst])
         return True
 
     # changes a route's state from dynamic to static    
@@ -127,9 +309,10 @@ class Middlebox:
             self.static_route.append(dst)
             # remove the dynamic route in the routing table
             try:
-                del self.routing_table[dst]
+                del self.writable_routing_table()[dst]
             except KeyError:
                 print("Unknown destination")
+            self.update_iBGP_routes([dst])
             return True
         # the route was already set as static route
         return False
@@ -156,31 +339,15 @@ class Middlebox:
     
     # check whether a packet is accepted by the router
     def check_acl(self, src, dst) -> bool:
-        for i in self.acl:
-            if i["src"] == src and i["dst"] == dst:
-                return i["act"]
-        return False
+        return self.access_list.check(src, dst)
 
     # add a rule into ACL list
     def add_acl(self, act, src, dst, pos=-1) -> bool:
-        acl = self.init_acl(act, src, dst)
-        if acl not in self.acl:
-            if pos == -1:
-                self.acl.append(acl)
-            else:
-                self.acl.insert(pos, acl)
-            return True
-        else:
-            return False
+        return self.writable_access_list().add(self.init_acl(act, src, dst), pos)
 
     # remove a rule from the ACL list
     def remove_acl(self, act, src, dst) -> bool:
-        acl = self.init_acl(act, src, dst)
-        try:
-            self.acl.remove(acl)
-            return True
-        except ValueError:
-            return False
+        return self.writable_access_list().remove(self.init_acl(act, src, dst))
 
     # return a new acl rule
     def init_acl(self, act, src, dst) -> dict:
@@ -209,81 +376,121 @@ class Middlebox:
     def receive_iBGP_ad(self, update):
         return NotImplemented
 
+    # routes received over iBGP, in the legacy format {dest: [[gate, advertiser]]}
+    # built from the RIB on every access, read self.rib for lookups
+    @property
+    def iBGP_msg(self) -> dict:
+        return self.rib.as_messages()
+
     def decode_iBGP_ad(self, update: list):
         destinations = update['dest']
         gate = update['gate']
         advertiser = update['advertiser']
+        rib = self.writable_rib()
         for dest in destinations:
-            if dest not in self.iBGP_msg.keys():
-                self.iBGP_msg[dest] = [[gate, advertiser]]
-            else:
-                if self.same_advertiser_exist(dest, advertiser):
-                    # print(self.get_id(), "exist same advertiser", gate, advertiser)
-                # if the same advertiser advertise different route to the same destination
-                # then the route may have altered
-                    self.remove_iBGP_ad(self.get_iBGP_ad(dest, advertiser), advertiser)
-                if dest not in self.iBGP_msg.keys():
-                    self.iBGP_msg[dest] = []
-                self.iBGP_msg[dest].append([gate, advertiser])
-
-            self.opt_iBGP_route(dest)
+            # if the same advertiser advertise different route to the same destination
+            # then the route may have altered, the new one replaces it
+            rib.add(dest, gate, advertiser)
+        # best paths of the whole update are chosen in one batch
+        self.opt_iBGP_routes(destinations)
 
     def remove_iBGP_ad(self, router, advert):
         # called when an iBGP session is down and self is the client
-        # print(self.get_id(), self.iBGP_msg, router, advert)
-        # print(self.get_id(), router, advert)
-        for dest in self.iBGP_msg.keys():
-            for i in self.iBGP_msg[dest]:
-                # the router is the advertiser of the iBGP msg or the gateway
-                # print(self.get_id(), "IBG_msg", i)
-                if router == i[0] and advert == i[1]:
-                    # if the router is one of the gateway routers to an external dest
-                    # print(self.get_id(), "removing", router, advert)
-                    # print("route removed")
-                    self.iBGP_msg[dest].remove(i)
-                    if not len(self.iBGP_msg[dest]):
-                        del self.iBGP_msg[dest]
-                        self.remove_routing_table(dest)
-                        return self.iBGP['client'], self.get_id(), None
-                    else:
-                        self.opt_iBGP_route(dest)
-                        router = self.routing_table[dest]
-                        ad = {
-                            'dest': [dest],
-                            'gate': router,
-                            'advertiser': self.get_id()
-                        }
+        # only the routes of the advertiser are visited
+        # returns None when no route was removed
+        prefixes = self.writable_rib().withdraw(router, advert)
+        if not prefixes:
+            return None
+        table = self.writable_routing_table()
+        remaining = []
+        for dest in prefixes:
+            if dest in self.rib:
+                remaining.append(dest)
+            else:
+                # no route left to this destination
+                table.pop(dest, None)
+        self.opt_iBGP_routes(remaining)
+        # the new best routes, one advertisement per gateway
+        by_gate = {}
+        for dest in remaining:
+            gate = self.rib.best[dest]
+            if gate is not None:
+                by_gate.setdefault(gate, []).append(dest)
+        ads = [{'dest': dests, 'gate': gate, 'advertiser': self.get_id()}
+               for gate, dests in by_gate.items()]
         # if self is a route reflector then return the list of client so that these clients also remove the ad from their list
-        return self.iBGP['client'], self.get_id(), ad
+        return self.iBGP['client'], self.get_id(), ads or None
 
     def get_iBGP_ad(self, dest, advert):
-        for i in self.iBGP_msg[dest]:
-            if i[1] == advert:
-                return i[0]
+        return self.rib.get(dest, advert)
 
     def same_advertiser_exist(self, dest, advert):
-        for i in self.iBGP_msg[dest]:
-            if i[1] == advert:
-                return True
-            return False
+        return advert in self.rib.routes(dest)
 
     def opt_iBGP_route(self, dest) -> None:
-        # choose iBGP route from the advertisement received
-        # append the next hop of the chosen route into the routing table
-        min_cost = float('inf')
-        min_gate = None
-        # compare the cost to each gateway within the AS
-        # acquire the gateway router with the least intra-AS distance
-        for i in self.iBGP_msg[dest]:
-            if self.graph.get_cost(i[0]) < min_cost:
-                min_gate = self.routing_table[i[0]]
-                min_cost = self.graph.get_cost(i[0])
-        self.append_routing_table(dest, min_gate)
+        self.opt_iBGP_routes([dest])
+
+    # choose the best path again for the prefixes routed through the given
+    # gateways, after their distance or next hop changed
+    # returns the prefixes whose next hop changed as {prefix: (old, new)}
+    def update_iBGP_routes(self, gates) -> dict:
+        if not self.rib:
+            return {}
+        return self.opt_iBGP_routes(self.rib.depending_on(gates))
+
+    # choose the iBGP route of every destination given
+    # the cost and next hop of each gateway are looked up once per batch
+    # a gateway without a route is not used, a destination without any usable
+    # gateway is removed from the routing table
+    # returns the destinations whose next hop changed as {dest: (old, new)}
+    def opt_iBGP_routes(self, dests) -> dict:
+        changes = {}
+        if not dests:
+            return changes
+        gates = {}
+        # read through the shared table and RIB, a fork copies them only
+        # once a best gateway or a next hop really changes
+        table = self.routing_table
+        by_prefix = self.rib.by_prefix
+        best = self.rib.best
+        missing = object()
+        for dest in dests:
+            # choose iBGP route from the advertisement received
+            # append the next hop of the chosen route into the routing table
+            min_cost = float('inf')
+            min_gate = None
+            # compare the cost to each gateway within the AS
+            # acquire the gateway router with the least intra-AS distance
+            for gate_id in by_prefix[dest].values():
+                gate = gates.get(gate_id)
+                if gate is None:
+                    nh = table.get(gate_id, missing)
+                    cost = self.engine.get_cost(self.id, gate_id) if nh is not missing else g.INF
+                    gate = gates[gate_id] = (cost, nh)
+                if gate[0] < min_cost:
+                    min_gate = gate_id
+                    min_cost = gate[0]
+            if best.get(dest, missing) != min_gate:
+                best = self.writable_rib().best
+                best[dest] = min_gate
+            old = table.get(dest, missing)
+            if min_gate is None:
+                if old is not missing:
+                    table = self.writable_routing_table()
+                    del table[dest]
+                    changes[dest] = (old, None)
+            else:
+                new = gates[min_gate][1]
+                if old is missing or old != new:
+                    table = self.writable_routing_table()
+                    table[dest] = new
+                    changes[dest] = (None if old is missing else old, new)
+        return changes
 
 
 class Router(Middlebox):
-    def __init__(self, router_id, nodes_map):
-        super().__init__(router_id, nodes_map)
+    def __init__(self, router_id, nodes_map, engine=None):
+        super().__init__(router_id, nodes_map, engine)
 
     def start_iBGP_session(self, sessions: dict):
         # one server opens up iBGP session with the client
@@ -302,8 +509,8 @@ class Router(Middlebox):
 
 
 class RR(Middlebox):
-    def __init__(self, router_id, graph):
-        super().__init__(router_id, graph)
+    def __init__(self, router_id, graph, engine=None):
+        super().__init__(router_id, graph, engine)
 
     def receive_iBGP_ad(self, update: dict) -> tuple:
         self.decode_iBGP_ad(update)
@@ -340,9 +547,17 @@ class RR(Middlebox):
 
 
 class Border(Middlebox):
-    def __init__(self, router_id, graph):
-        super().__init__(router_id, graph)
+    def __init__(self, router_id, graph, engine=None):
+        super().__init__(router_id, graph, engine)
         self.eBGP_sessions = []
+        self.eBGP_prefixes = set()
+        # whether a fork shares the external prefixes
+        self._eBGP_shared = False
+
+    def fork(self, engine) -> 'Border':
+        other = super().fork(engine)
+        self._eBGP_shared = other._eBGP_shared = True
+        return other
 
     def start_iBGP_session(self, sessions: dict):
         self.iBGP['server'] += [i for i in sessions[self.get_id()]['server']]
@@ -356,13 +571,39 @@ class Border(Middlebox):
     def get_iBGP_client(self) -> list:
         return self.iBGP['client'].copy()
 
-    def insert_eBGP(self, prefix):
-        self.append_routing_table(prefix, None)
-        self.eBGP_sessions.append(prefix)
-        return self.draft_iBGP_ad()
+    # the external prefixes stay routed out of the AS
+    def update_routing_table(self):
+        super().update_routing_table()
+        table = self.routing_table
+        for prefix in self.eBGP_prefixes:
+            table[prefix] = None
 
-    def draft_iBGP_ad(self) -> tuple:
-        return {"dest": [i for i in self.eBGP_sessions], "gate": self.get_id(), "advertiser": self.get_id()}
+    # returns the advertisement of the new prefix only
+    def insert_eBGP(self, prefix):
+        return self.insert_eBGP_table([prefix])
+
+    # install a table of external prefixes at once
+    # returns the advertisement of the prefixes that were not known yet
+    def insert_eBGP_table(self, prefixes) -> dict:
+        table = self.writable_routing_table()
+        if self._eBGP_shared:
+            self.eBGP_sessions = self.eBGP_sessions.copy()
+            self.eBGP_prefixes = self.eBGP_prefixes.copy()
+            self._eBGP_shared = False
+        new = []
+        for prefix in prefixes:
+            if prefix not in self.eBGP_prefixes:
+                self.eBGP_prefixes.add(prefix)
+                self.eBGP_sessions.append(prefix)
+                new.append(prefix)
+            table[prefix] = None
+        return self.draft_iBGP_ad(new)
+
+    # advertisement of the given prefixes, all external prefixes by default
+    def draft_iBGP_ad(self, prefixes=None) -> dict:
+        if prefixes is None:
+            prefixes = self.eBGP_sessions
+        return {"dest": list(prefixes), "gate": self.get_id(), "advertiser": self.get_id()}
 
     def receive_iBGP_ad(self, update: dict) -> None:
         self.decode_iBGP_ad(update)
@@ -0,0 +1,376 @@
+from heapq import heappush, heappop
+import network_simulator.graph as g
+import network_simulator.parallel as par
+
+
+# topology-wide routing state shared by all routers of a simulator
+# one graph is kept for the whole topology and the shortest path tree of
+# every source is computed once and cached, routers read their row from here
+# with workers > 1, whole batches of trees are computed by a pool of worker
+# processes (see parallel.TreePool), with the same results as the serial path
+class RoutingEngine:
+    # with ecmp, routers forward over every equal-cost next hop, see get_next_hops
+    def __init__(self, graph: g.Graph, workers=None, ecmp=False):
+        self.graph = graph
+        # shortest path trees indexed by source router id
+        self.trees = {}
+        self.ecmp = ecmp
+        # source -> (topology version, equal-cost next hops of every destination)
+        self.multipath = {}
+        # sources whose tree the engine may repair in place, None for all of
+        # them; a tree shared with a fork is copied before its first repair
+        self.owned = None
+        self.pool = par.TreePool(workers) if workers is not None and workers > 1 else None
+        # whether the pool was started by this engine rather than borrowed
+        self.owns_pool = self.pool is not None
+
+    # engine of a forked simulator over a fork of the graph, see Graph.fork
+    # the trees are shared until a link change repairs them, the fork borrows
+    # the worker pool of this engine
+    def fork(self) -> 'RoutingEngine':
+        other = RoutingEngine(self.graph.fork(), ecmp=self.ecmp)
+        other.trees = dict(self.trees)
+        other.multipath = dict(self.multipath)
+        other.pool = self.pool
+        self.owned = set()
+        other.owned = set()
+        return other
+
+    # compute the trees of the given sources (all routers by default) in one batch
+    def compute_all(self, sources=None) -> None:
+        if sources is None:
+            sources = self.graph.map.keys()
+        trees = self.compute(sources)
+        self.trees.update(trees)
+        self.own(trees)
+
+    # fresh trees of the given sources as {source: tree}, nothing is cached
+    def compute(self, sources) -> dict:
+        sources = list(sources)
+        if self.pool is not None and len(sources) > 1:
+            return self.pool.compute(self.graph, sources)
+        return {s: self.graph.shortest_path_tree(s) for s in sources}
+
+    # record trees computed by this engine, which no fork shares
+    def own(self, sources) -> None:
+        if self.owned is not None:
+            self.owned.update(sources)
+
+    # stop the worker processes, if any; a borrowed pool is left running
+    def close(self) -> None:
+        if self.pool is not None:
+            if self.owns_pool:
+                self.pool.close()
+            self.pool = None
+
+    def get_tree(self, source) -> g.ShortestPathTree:
+        tree = self.trees.get(source)
+        if tree is None:
+            tree = self.trees[source] = self.graph.shortest_path_tree(source)
+            self.own([source])
+        return tree
+
+    # routing table of a source in the format returned by Graph.dijkstra
+    def get_routing_table(self, source) -> dict:
+        return self.graph.routing_from_tree(self.get_tree(source))
+
+    def get_next_hop(self, source, dst):
+        csr = self.graph.get_csr()
+        tree = self.get_tree(source)
+        f = tree.first[csr.index[dst]]
+        return csr.nodes[f] if f >= 0 else None
+
+    # equal-cost next hops from a source as {dst: tuple of next hops}, the
+    # next hop of the routing table being one of them; built from the tree
+    # distances on first use after each topology change
+    def get_next_hops(self, source) -> dict:
+        cached = self.multipath.get(source)
+        if cached is not None and cached[0] == self.graph.version:
+            return cached[1]
+        table = self.graph.multipath_from_tree(self.get_tree(source))
+        self.multipath[source] = (self.graph.version, table)
+        return table
+
+    def get_cost(self, source, dst):
+        return self.graph.cost_from_tree(self.get_tree(source), self.graph.get_csr().index[dst])
+
+    # drop every cached tree, they are recomputed on the next access
+    def invalidate(self) -> None:
+        self.trees.clear()
+
+    # apply a link change the same way Middlebox.update_graph does:
+    # a cost of 0 destroys the link, otherwise an existing link is updated
+    # cached trees are repaired in place rather than recomputed, the result maps
+    # each source to the destinations whose cost or first hop changed, given as
+    # {dst: (old next hop, new next hop)} with None for an unreachable destination
+    def update_link(self, n1, n2, cost) -> dict:
+        if not self.graph.has_link(n1, n2):
+            return {}
+        old = self.graph.map[n1][n2]
+        if not cost:
+            self.graph.destroy_link(n1, n2)
+            new = g.INF
+        else:
+            self.graph.update_cost(n1, n2, cost)
+            new = cost
+        if new == old:
+            return {}
+        csr = self.graph.get_csr()
+        i, j = csr.index[n1], csr.index[n2]
+        changes = {}
+        for source, tree in self.trees.items():
+            if self.owned is not None and source not in self.owned:
+                if not self.is_affected(tree, [(i, j, old, new)]):
+                    continue
+                tree = self.trees[source] = tree.copy()
+                self.owned.add(source)
+            changed = self.repair(tree, i, j, old, new)
+            if changed:
+                changes[source] = changed
+        return changes
+
+    # apply the link operations staged in a batch and recompute every affected
+    # tree once, trees whose reachable part does not see any of the changes are
+    # skipped, the result has the same format as update_link
+    def commit(self, batch) -> dict:
+        csr = self.graph.get_csr()
+        # net weight change of every touched link, INF standing for no link
+        net = {}
+        for op, n1, n2, cost in batch.ops:
+            key = (n1, n2) if csr.index[n1] < csr.index[n2] else (n2, n1)
+            if key not in net:
+                net[key] = self.graph.map[n1].get(n2, g.INF)
+            if op == 'update':
+                self.graph.update_cost(n1, n2, cost)
+            elif op == 'existing':
+                if self.graph.has_link(n1, n2):
+                    self.graph.update_cost(n1, n2, cost)
+            elif op == 'create':
+                self.graph.create_link(n1, n2, cost)
+            else:
+                self.graph.destroy_link(n1, n2)
+        links = []
+        for (n1, n2), old in net.items():
+            new = self.graph.map[n1].get(n2, g.INF)
+            if new != old:
+                links.append((csr.index[n1], csr.index[n2], old, new))
+        if not links:
+            return {}
+        affected = [source for source, tree in self.trees.items() if self.is_affected(tree, links)]
+        changes = {}
+        trees = self.compute(affected)
+        for source, tree in trees.items():
+            changed = self.compare(self.trees[source], tree)
+            self.trees[source] = tree
+            if changed:
+                changes[source] = changed
+        self.own(trees)
+        return changes
+
+    # whether a tree can change under the given link changes
+    # a dearer link matters only when it is a tree link and a cheaper link only
+    # when it shortens or ties the path to one of its ends, a tie possibly
+    # giving that end another parent; links between nodes the source cannot
+    # reach never match either condition
+    def is_affected(self, tree: g.ShortestPathTree, links) -> bool:
+        dist, pred = tree.dist, tree.pred
+        for i, j, old, new in links:
+            if new > old:
+                if pred[j] == i or pred[i] == j:
+                    return True
+            elif (dist[i] + new <= dist[j] or dist[j] + new <= dist[i]) and min(dist[i], dist[j]) != g.INF:
+                return True
+        return False
+
+    # next hop changes between two trees of the same source
+    def compare(self, old: g.ShortestPathTree, new: g.ShortestPathTree) -> dict:
+        nodes = self.graph.get_csr().nodes
+        changes = {}
+        for v in range(len(nodes)):
+            f, nf = old.first[v], new.first[v]
+            if old.dist[v] != new.dist[v] or f != nf:
+                changes[nodes[v]] = (nodes[f] if f >= 0 else None,
+                                     nodes[nf] if nf >= 0 else None)
+        return changes
+
+    # dynamic SSSP repair of one tree after the weight of link i-j went from
+    # old to new, in the style of Ramalingam-Reps: only the nodes whose
+    # shortest path can change are visited
+    def repair(self, tree: g.ShortestPathTree, i, j, old, new) -> dict:
+        dist, pred, first = tree.dist, tree.pred, tree.first
+        if new < old:
+            # a cheaper link can only shorten paths running through it
+            before = {}
+            heap = []
+            for u, v in ((i, j), (j, i)):
+                nd = dist[u] + new
+                if nd < dist[v]:
+                    before[v] = (dist[v], first[v])
+                    self.settle(tree, u, v, nd)
+                    heappush(heap, (nd, v))
+            self.propagate(tree, heap, before)
+            # the link can also become a tie without shortening anything
+            self.retie(tree, before, ((i, j, new), (j, i, new)))
+        else:
+            # a dearer link only matters when it is part of the tree,
+            # then the whole subtree below it has to find new paths
+            if pred[j] == i:
+                root = j
+            elif pred[i] == j:
+                root = i
+            else:
+                return {}
+            affected = self.subtree(tree, root)
+            before = {v: (dist[v], first[v]) for v in affected}
+            for v in affected:
+                dist[v] = g.INF
+                pred[v] = -1
+                first[v] = -1
+            csr = self.graph.get_csr()
+            offsets, neighbors, weights = csr.offsets, csr.neighbors, csr.weights
+            heap = []
+            # best entry point into the subtree from the untouched part of the tree
+            for v in affected:
+                for k in range(offsets[v], offsets[v + 1]):
+                    u = neighbors[k]
+                    if u not in before:
+                        nd = dist[u] + weights[k]
+                        if nd < dist[v]:
+                            self.settle(tree, u, v, nd)
+                if dist[v] != g.INF:
+                    heappush(heap, (dist[v], v))
+            self.propagate(tree, heap, before)
+            self.retie(tree, before)
+        return self.diff(tree, before)
+
+    # dijkstra restricted to the nodes reached from the heap
+    # every node whose entry is rewritten is recorded in before
+    def propagate(self, tree: g.ShortestPathTree, heap, before) -> None:
+        csr = self.graph.get_csr()
+        offsets, neighbors, weights = csr.offsets, csr.neighbors, csr.weights
+        dist = tree.dist
+        while heap:
+            d, u = heappop(heap)
+            if d > dist[u]:
+                continue
+            for k in range(offsets[u], offsets[u + 1]):
+                v = neighbors[k]
+                nd = d + weights[k]
+                if nd < dist[v]:
+                    if v not in before:
+                        before[v] = (dist[v], tree.first[v])
+                    self.settle(tree, u, v, nd)
+                    heappush(heap, (nd, v))
+
+    # pick the parents heap dijkstra would: among the neighbors u on a
+    # shortest path to v, the one with the smallest (dist[u], CSR index),
+    # then redo the first hops below every node whose parent changed; the
+    # repair visits ties in its own order, so without this a change and
+    # its undo could leave different tables than a fresh computation
+    # a node keeps its parent unless it was rewritten, a rewritten node
+    # whose distance moved now ties for it, or it ties over one of the
+    # (u, v, weight) links of ties; nodes whose first hop changes join before
+    def retie(self, tree: g.ShortestPathTree, before, ties=()) -> None:
+        csr = self.graph.get_csr()
+        offsets, neighbors, weights = csr.offsets, csr.neighbors, csr.weights
+        dist, pred, first = tree.dist, tree.pred, tree.first
+        source = tree.source
+        roots = []
+        for v, (d, _) in before.items():
+            dv = dist[v]
+            if dv == g.INF:
+                continue
+            moved = dv != d
+            best = -1
+            for k in range(offsets[v], offsets[v + 1]):
+                u = neighbors[k]
+                du = dist[u]
+                if du + weights[k] == dv:
+                    if best < 0 or du < dist[best] or (du == dist[best] and u < best):
+                        best = u
+                elif moved and du != g.INF and dv + weights[k] == du and u not in before:
+                    # u has a parent here, it is reachable and not the source
+                    p = pred[u]
+                    if p >= 0 and (dv < dist[p] or (dv == dist[p] and v < p)):
+                        pred[u] = v
+                        roots.append(u)
+            if best != pred[v]:
+                pred[v] = best
+                roots.append(v)
+        for u, v, w in ties:
+            if v != source and v not in before and dist[u] + w == dist[v] != g.INF:
+                p = pred[v]
+                if p >= 0 and (dist[u] < dist[p] or (dist[u] == dist[p] and u < p)):
+                    pred[v] = u
+                    roots.append(v)
+        # parents are closer to the source than their children, so taking
+        # the roots by distance settles every first hop before it is read
+        done = set()
+        for root in sorted(roots, key=dist.__getitem__):
+            if root in done:
+                continue
+            p = pred[root]
+            if (root if p == source else first[p]) == first[root]:
+                continue
+            for v in self.subtree(tree, root):
+                done.add(v)
+                p = pred[v]
+                f = v if p == source else first[p]
+                if f != first[v]:
+                    if v not in before:
+                        before[v] = (dist[v], first[v])
+                    first[v] = f
+
+    def settle(self, tree: g.ShortestPathTree, u, v, d) -> None:
+        tree.dist[v] = d
+        tree.pred[v] = u
+        tree.first[v] = v if u == tree.source else tree.first[u]
+
+    # nodes below root in the tree, parents always come before their children
+    def subtree(self, tree: g.ShortestPathTree, root) -> list:
+        csr = self.graph.get_csr()
+        offsets, neighbors = csr.offsets, csr.neighbors
+        pred = tree.pred
+        nodes = [root]
+        for x in nodes:
+            for k in range(offsets[x], offsets[x + 1]):
+                c = neighbors[k]
+                if pred[c] == x:
+                    nodes.append(c)
+        return nodes
+
+    # translate the rewritten tree entries into next hop changes
+    def diff(self, tree: g.ShortestPathTree, before) -> dict:
+        nodes = self.graph.get_csr().nodes
+        changes = {}
+        for v, (d, f) in before.items():
+            if tree.dist[v] != d or tree.first[v] != f:
+                changes[nodes[v]] = (nodes[f] if f >= 0 else None,
+                                     nodes[tree.first[v]] if tree.first[v] >= 0 else None)
+        return changes
+
+
+# link operations staged for RoutingEngine.commit
+# the methods mirror the ones of Graph, nothing is applied until the commit
+class LinkBatch:
+    def __init__(self):
+        self.ops = []
+        # next hop changes of the commit, filled in by the simulator
+        self.delta = None
+
+    def update_cost(self, n1, n2, cost) -> None:
+        self.ops.append(('update', n1, n2, cost))
+
+    def create_link(self, n1, n2, cost=1) -> None:
+        self.ops.append(('create', n1, n2, cost))
+
+    def destroy_link(self, n1, n2) -> None:
+        self.ops.append(('destroy', n1, n2, None))
+
+    # same semantics as Simulator.update_link_cost: a cost of 0 destroys the
+    # link, otherwise only an existing link is updated
+    def update_link(self, n1, n2, cost) -> None:
+        if not cost:
+            self.destroy_link(n1, n2)
+        else:
+            self.ops.append(('existing', n1, n2, cost))
@@ -0,0 +1,191 @@
+import math
+import random
+import network_simulator as ns
+
+# seeded topology generators returning a graph_config, router ids are
+# 0..n-1; links cost 1 unless max_cost is given, then each link gets a
+# random cost in 1..max_cost drawn from the same seed
+
+
+def add_link(nodes_map, a, b, cost=1) -> None:
+    nodes_map[a][b] = cost
+    nodes_map[b][a] = cost
+
+
+# draw the link costs, in link order so that the result only depends on the seed
+def weigh(nodes_map, max_cost, rng) -> dict:
+    if max_cost is None:
+        return nodes_map
+    for a in nodes_map:
+        for b in nodes_map[a]:
+            if a < b:
+                add_link(nodes_map, a, b, rng.randint(1, max_cost))
+    return nodes_map
+
+
+def ring(n, seed=0, max_cost=None) -> dict:
+    nodes_map = {i: {} for i in range(n)}
+    if n > 1:
+        for i in range(n):
+            add_link(nodes_map, i, (i + 1) % n)
+    return weigh(nodes_map, max_cost, random.Random(seed))
+
+
+# rows x cols mesh, router r * cols + c sits in row r and column c
+def grid(rows, cols, seed=0, max_cost=None) -> dict:
+    nodes_map = {i: {} for i in range(rows * cols)}
+    for r in range(rows):
+        for c in range(cols):
+            if c + 1 < cols:
+                add_link(nodes_map, r * cols + c, r * cols + c + 1)
+            if r + 1 < rows:
+                add_link(nodes_map, r * cols + c, (r + 1) * cols + c)
+    return weigh(nodes_map, max_cost, random.Random(seed))
+
+
+# switches of a k-ary fat-tree, k even: (k/2)^2 core switches first, then
+# every pod's k/2 aggregation and k/2 edge switches; 5k^2/4 routers in all
+def fat_tree(k, seed=0, max_cost=None) -> dict:
+    if k < 2 or k % 2:
+        raise ValueError("a fat-tree needs an even k of at least 2")
+    half = k // 2
+    cores = half * half
+    nodes_map = {i: {} for i in range(cores + k * k)}
+    for pod in range(k):
+        base = cores + pod * k
+        for a in range(half):
+            agg = base + a
+            # aggregation switch a of every pod reaches the same core group
+            for c in range(half):
+                add_link(nodes_map, agg, a * half + c)
+            for e in range(half):
+                add_link(nodes_map, agg, base + half + e)
+    return weigh(nodes_map, max_cost, random.Random(seed))
+
+
+# Waxman graph: routers placed at random in the unit square, a link a-b
+# exists with probability beta * exp(-d(a, b) / (alpha * L)), L being the
+# diagonal of the unit square (sqrt 2), which bounds the distance of any two
+# routers; disconnected parts are joined by their closest routers
+# without max_cost, a link costs its length in tenths, at least 1
+def waxman(n, alpha=0.4, beta=0.4, seed=0, max_cost=None) -> dict:
+    rng = random.Random(seed)
+    points = [(rng.random(), rng.random()) for _ in range(n)]
+    nodes_map = {i: {} for i in range(n)}
+    dist = lambda a, b: math.dist(points[a], points[b])
+    cost = lambda a, b: max(1, round(dist(a, b) * 10))
+    scale = alpha * math.sqrt(2)
+    for a in range(n):
+        for b in range(a + 1, n):
+            if rng.random() < beta * math.exp(-dist(a, b) / scale):
+                add_link(nodes_map, a, b, cost(a, b))
+    # join the components in id order, each to the closest router reached so far
+    reached = set()
+    for a in range(n):
+        if a in reached:
+            continue
+        component = components_of(nodes_map, a)
+        if reached:
+            x, y = min(((x, y) for x in component for y in reached), key=lambda link: dist(*link))
+            add_link(nodes_map, x, y, cost(x, y))
+        reached |= component
+    return weigh(nodes_map, max_cost, rng)
+
+
+def components_of(nodes_map, start) -> set:
+    seen = {start}
+    stack = [start]
+    while stack:
+        for nb in nodes_map[stack.pop()]:
+            if nb not in seen:
+                seen.add(nb)
+                stack.append(nb)
+    return seen
+
+
+# Barabasi-Albert graph: a clique of m + 1 routers, then every new router
+# links to m distinct routers picked proportionally to their degree
+def barabasi_albert(n, m=2, seed=0, max_cost=None) -> dict:
+    rng = random.Random(seed)
+    nodes_map = {i: {} for i in range(n)}
+    # every router appears once per link end, a uniform pick is degree-biased
+    ends = []
+    for a in range(min(m + 1, n)):
+        for b in range(a):
+            add_link(nodes_map, a, b)
+            ends += (a, b)
+    for a in range(m + 1, n):
+        targets = set()
+        while len(targets) < m:
+            targets.add(rng.choice(ends))
+        for b in sorted(targets):
+            add_link(nodes_map, a, b)
+            ends += (a, b)
+    return weigh(nodes_map, max_cost, rng)
+
+
+# connected random graph with n nodes and m undirected links, at most one
+# link per pair; an m below n - 1 still gets the n - 1 links keeping it connected
+def random_graph(n, m, seed=0, max_cost=10) -> dict:
+    if m > n * (n - 1) // 2:
+        raise ValueError("%d routers have at most %d links, not %d" % (n, n * (n - 1) // 2, m))
+    rng = random.Random(seed)
+    nodes_map = {i: {} for i in range(n)}
+    # a random spanning tree keeps the graph connected
+    order = list(range(n))
+    rng.shuffle(order)
+    links = 0
+    for i in range(1, n):
+        a, b = order[i], order[rng.randrange(i)]
+        add_link(nodes_map, a, b, rng.randint(1, max_cost))
+        links += 1
+    while links < m:
+        a, b = rng.randrange(n), rng.randrange(n)
+        if a != b and b not in nodes_map[a]:
+            add_link(nodes_map, a, b, rng.randint(1, max_cost))
+            links += 1
+    return nodes_map
+
+
+def count_links(nodes_map) -> int:
+    return sum(len(nbs) for nbs in nodes_map.values()) // 2
+
+
+# ibgp_config without BGP, every router a plain client
+def plain_config(graph_config) -> dict:
+    return {i: ns.init_bgp_config([], [], 1) for i in graph_config}
+
+
+# ibgp_config of a route reflector hierarchy over the routers in id order:
+# the first routers are border routers, then one tier of route reflectors
+# per entry of reflectors, the rest are clients; every border router serves
+# every reflector of the first tier, each lower tier (ending with the
+# clients) is spread round-robin over the reflectors of the tier above
+def reflector_config(graph_config, borders=2, reflectors=(4,)) -> dict:
+    if isinstance(reflectors, int):
+        reflectors = (reflectors,)
+    nodes = list(graph_config)
+    tiers = [nodes[:borders]]
+    start = borders
+    for size in reflectors:
+        if size:
+            tiers.append(nodes[start:start + size])
+            start += size
+    tiers.append(nodes[start:])
+    config = {}
+    for depth, tier in enumerate(tiers):
+        router_type = 3 if depth == 0 else 1 if depth == len(tiers) - 1 else 2
+        for i in tier:
+            config[i] = ns.init_bgp_config([], [], router_type)
+
+    def serve(server, client):
+        config[server]["client"].append(client)
+        config[client]["server"].append(server)
+
+    for b in tiers[0]:
+        for i in tiers[1]:
+            serve(b, i)
+    for upper, lower in zip(tiers[1:-1], tiers[2:]):
+        for k, i in enumerate(lower):
+            serve(upper[k % len(upper)], i)
+    return config
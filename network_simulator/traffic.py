@@ -0,0 +1,166 @@
+from array import array
+import network_simulator.forwarding as fw
+
+
+# demand volumes between router pairs forwarded over the routing tables,
+# with the resulting load of every directed link
+# the demands towards one destination are aggregated over its forwarding
+# tree: a router passes on its own demand plus all it receives, so each
+# destination costs one pass over the routers its traffic crosses instead
+# of one walk per demand; with ECMP the volume is split evenly over the
+# equal-cost next hops
+# forwarding follows Middlebox.forward but ACLs are not applied, the loads
+# are the traffic offered along the routes
+# the simulator marks the destinations whose routes change, only their
+# demands are forwarded again when the loads are read next
+class TrafficMatrix:
+    def __init__(self, simulator, demands: dict):
+        self.simulator = simulator
+        # dst -> {src: volume}
+        self.demands = {}
+        # directed links and their load, aligned; every link of the topology
+        # gets a slot up front, links created later are added on first use
+        self.links = []
+        self.index = {}
+        self.loads = array('d')
+        graph = simulator.engine.graph
+        for a in graph.map:
+            for b in graph.map[a]:
+                self.slot(a, b)
+        # dst -> ({slot: volume}, {Outcome: volume}) of its last forwarding
+        self.flows = {}
+        # destinations to forward again
+        self.dirty = set()
+        for (src, dst), volume in demands.items():
+            self.set_demand(src, dst, volume)
+        simulator.matrices.add(self)
+
+    def slot(self, a, b) -> int:
+        k = self.index.get((a, b))
+        if k is None:
+            k = self.index[(a, b)] = len(self.links)
+            self.links.append((a, b))
+            self.loads.append(0.0)
+        return k
+
+    # change the volume of one demand, a volume of 0 removes it
+    def set_demand(self, src, dst, volume) -> None:
+        if volume:
+            self.demands.setdefault(dst, {})[src] = volume
+        elif src in self.demands.get(dst, ()):
+            del self.demands[dst][src]
+        self.dirty.add(dst)
+
+    # forward the demands towards the given destinations again on next read
+    def invalidate(self, dsts) -> None:
+        self.dirty.update(dst for dst in dsts if dst in self.demands or dst in self.flows)
+
+    # forward every demand again, after changes the simulator does not report
+    def refresh(self) -> None:
+        self.dirty.update(self.demands)
+        self.dirty.update(self.flows)
+
+    def update(self) -> None:
+        for dst in self.dirty:
+            old = self.flows.pop(dst, None)
+            if old is not None:
+                for k, volume in old[0].items():
+                    self.loads[k] -= volume
+            if self.demands.get(dst):
+                self.flows[dst] = self.forward(dst)
+                for k, volume in self.flows[dst][0].items():
+                    self.loads[k] += volume
+        self.dirty.clear()
+
+    # per link loads as an array aligned with self.links
+    def get_loads(self) -> array:
+        self.update()
+        return self.loads
+
+    def get_load(self, a, b):
+        self.update()
+        k = self.index.get((a, b))
+        return 0.0 if k is None else self.loads[k]
+
+    # load over capacity of every link, aligned with self.links; capacity is
+    # one number for all links or a {(a, b): capacity} dictionary
+    def utilization(self, capacity) -> array:
+        loads = self.get_loads()
+        if isinstance(capacity, dict):
+            return array('d', (load / capacity[link] for link, load in zip(self.links, loads)))
+        return array('d', (load / capacity for load in loads))
+
+    # total volume of every fate, {Outcome: volume}: DELIVERED, EXITED the AS,
+    # UNREACHABLE, or caught in a forwarding LOOP
+    def outcomes(self) -> dict:
+        self.update()
+        total = {}
+        for _, fates in self.flows.values():
+            for outcome, volume in fates.items():
+                total[outcome] = total.get(outcome, 0) + volume
+        return total
+
+    # next hops of a router towards dst, or the Outcome ending the traffic there
+    def next_hops(self, router_id, dst):
+        if router_id == dst:
+            return fw.Outcome.DELIVERED
+        router = self.simulator.routers.get(router_id)
+        if router is None:
+            return fw.Outcome.UNREACHABLE
+        nh = router.routing_table.get(dst, fw.NO_ROUTE)
+        if nh is None:
+            return fw.Outcome.EXITED
+        if nh == fw.NO_ROUTE:
+            return fw.Outcome.UNREACHABLE
+        if router.engine.ecmp:
+            return router.multipath(dst, nh)
+        return (nh,)
+
+    # link loads and fates of the demands towards one destination
+    def forward(self, dst) -> tuple:
+        volume = dict(self.demands[dst])
+        # the part of the forwarding graph the traffic reaches, and the
+        # number of routers feeding every router in it
+        succ = {}
+        waiting = {}
+        stack = list(volume)
+        while stack:
+            r = stack.pop()
+            if r in succ:
+                continue
+            hops = succ[r] = self.next_hops(r, dst)
+            waiting.setdefault(r, 0)
+            if type(hops) is tuple:
+                for h in hops:
+                    waiting[h] = waiting.get(h, 0) + 1
+                    if h not in succ:
+                        stack.append(h)
+        # a router forwards once everything flowing into it arrived
+        ready = [r for r, n in waiting.items() if not n]
+        loads = {}
+        fates = {}
+        slot = self.index
+        while ready:
+            r = ready.pop()
+            v = volume.get(r, 0)
+            hops = succ[r]
+            if type(hops) is not tuple:
+                if v:
+                    fates[hops] = fates.get(hops, 0) + v
+                continue
+            share = v / len(hops)
+            for h in hops:
+                if share:
+                    k = slot.get((r, h))
+                    if k is None:
+                        k = self.slot(r, h)
+                    loads[k] = loads.get(k, 0) + share
+                    volume[h] = volume.get(h, 0) + share
+                waiting[h] -= 1
+                if not waiting[h]:
+                    ready.append(h)
+        # routers never released are on a loop or only fed by one
+        looped = sum(volume.get(r, 0) for r, n in waiting.items() if n)
+        if looped:
+            fates[fw.Outcome.LOOP] = looped
+        return loads, fates
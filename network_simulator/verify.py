@@ -0,0 +1,120 @@
+from array import array
+import network_simulator.forwarding as fw
+
+# tail state of a router whose outcome depends on the source
+UNKNOWN = -1
+
+
+# outcome of every (src, dst) pair as a forwarding.Outcome code, DELIVERED
+# meaning reachable; rows are all routers, columns the verified destinations
+class ReachabilityMatrix:
+    def __init__(self, ids, dsts):
+        self.ids = ids
+        self.dsts = dsts
+        self.rows = {router_id: i for i, router_id in enumerate(ids)}
+        self.cols = {dst: j for j, dst in enumerate(dsts)}
+        self.outcome = array('b', [UNKNOWN]) * (len(ids) * len(dsts))
+
+    def get(self, src, dst) -> fw.Outcome:
+        return fw.Outcome(self.outcome[self.rows[src] * len(self.dsts) + self.cols[dst]])
+
+    def is_reachable(self, src, dst) -> bool:
+        return self.get(src, dst) == fw.Outcome.DELIVERED
+
+    # pairs that are not reachable
+    def failures(self) -> list:
+        width = len(self.dsts)
+        return [(self.ids[k // width], self.dsts[k % width])
+                for k, code in enumerate(self.outcome) if code != fw.Outcome.DELIVERED]
+
+
+# verify every source against the given destinations (all routers by default)
+# with the semantics of Simulator.analyze_reachability
+def verify_all(simulator, destinations=None) -> ReachabilityMatrix:
+    ids = list(simulator.routers.keys())
+    if destinations is None:
+        destinations = ids
+    matrix = ReachabilityMatrix(ids, list(destinations))
+    # routers whose ACL gives the same decision for every pair
+    uniform = {router_id: router.access_list.check_all()
+               for router_id, router in simulator.routers.items()}
+    for j, dst in enumerate(matrix.dsts):
+        verify_destination(simulator, matrix, j, dst, uniform)
+    return matrix
+
+
+# fill the column of one destination
+# the forwarding tree towards dst is walked once: every router whose ACL
+# decision for dst does not depend on the source gets its outcome memoized,
+# walks from the sources then stop at the first memoized router
+def verify_destination(simulator, matrix: ReachabilityMatrix, j, dst, uniform) -> None:
+    routers = simulator.routers
+    has_link = simulator.engine.graph.has_link
+    # next hop of every router towards dst, or the outcome ending the walk there
+    nhs = {}
+    for router_id, router in routers.items():
+        nh = router.routing_table.get(dst, fw.NO_ROUTE)
+        if nh is None:
+            nhs[router_id] = fw.Outcome.EXITED
+        elif nh == fw.NO_ROUTE or nh not in routers:
+            nhs[router_id] = fw.Outcome.UNREACHABLE
+        elif dst in router.static_route and not has_link(router_id, nh):
+            # dynamic next hops always follow a link, static ones may not
+            nhs[router_id] = fw.Outcome.UNREACHABLE
+        else:
+            nhs[router_id] = nh
+    tail = {dst: fw.Outcome.DELIVERED} if dst in routers else {}
+    for start in routers:
+        # follow the tree until a known tail, memoizing the whole chain
+        chain = []
+        on_chain = set()
+        r = start
+        while r not in tail:
+            decision = uniform[r]
+            if decision is None:
+                decision = routers[r].access_list.check_dst(dst)
+                if decision is None:
+                    tail[r] = UNKNOWN
+                    break
+            if not decision:
+                tail[r] = fw.Outcome.DENIED
+                break
+            nh = nhs[r]
+            if isinstance(nh, fw.Outcome):
+                tail[r] = nh
+                break
+            chain.append(r)
+            on_chain.add(r)
+            if nh in on_chain:
+                # every router on a cycle allows the traffic, it loops
+                tail[nh] = fw.Outcome.LOOP
+                break
+            r = nh
+        for c in reversed(chain):
+            if c not in tail:
+                tail[c] = tail[nhs[c]]
+    width = len(matrix.dsts)
+    for i, src in enumerate(matrix.ids):
+        code = tail[src]
+        if code == UNKNOWN:
+            code = walk(routers, nhs, tail, src, dst)
+        matrix.outcome[i * width + j] = code
+
+
+# walk from src through the routers whose outcome depends on the source
+def walk(routers, nhs, tail, src, dst):
+    seen = {src}
+    r = src
+    while True:
+        code = tail[r]
+        if code != UNKNOWN:
+            return code
+        if not routers[r].check_acl(src, dst):
+            return fw.Outcome.DENIED
+        nh = nhs[r]
+        if isinstance(nh, fw.Outcome):
+            return nh
+        if nh in seen:
+            return fw.Outcome.LOOP
+        seen.add(nh)
+        r = nh
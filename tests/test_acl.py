@@ -0,0 +1,51 @@
+import random
+import unittest
+import network_simulator.acl as ac
+
+
+# positional installs and removals must keep the rules in the order a plain
+# list.insert / list.remove would, across chunk splits and key relabels
+class OrderTest(unittest.TestCase):
+    def setUp(self):
+        self.saved = ac.CHUNK, ac.GAP
+        # tiny chunks and gaps so that splits and relabels happen all the time
+        ac.CHUNK, ac.GAP = 4, 1 << 16
+
+    def tearDown(self):
+        ac.CHUNK, ac.GAP = self.saved
+
+    def test_matches_list(self):
+        for seed in range(10):
+            rng = random.Random(seed)
+            expected = []
+            access_list = ac.AccessList()
+            for i in range(600):
+                if rng.random() < 0.7 or not expected:
+                    rule = {"act": rng.random() < 0.5, "src": i, "dst": rng.choice([1, ac.ANY])}
+                    pos = rng.choice([-1, 0, 3, len(expected) // 2, rng.randrange(-5, len(expected) + 3)])
+                    self.assertTrue(access_list.add(rule, pos))
+                    if pos == -1:
+                        expected.append(rule)
+                    else:
+                        expected.insert(pos, rule)
+                else:
+                    self.assertTrue(access_list.remove(expected.pop(rng.randrange(len(expected)))))
+            self.assertEqual(access_list.rules, expected)
+            for src in range(600):
+                first = next((rule["act"] for rule in expected if rule["src"] == src), False)
+                self.assertEqual(access_list.check(src, 1), first)
+
+    def test_same_position(self):
+        access_list = ac.AccessList()
+        for i in range(10):
+            access_list.add({"act": True, "src": i, "dst": 0})
+        for i in range(300):
+            access_list.add({"act": True, "src": i, "dst": 1}, 5)
+        self.assertEqual([(rule["src"], rule["dst"]) for rule in access_list.rules[4:7]],
+                         [(4, 0), (299, 1), (298, 1)])
+        keys = [entry[0] for chunk in access_list.order.chunks for entry in chunk.entries]
+        self.assertEqual(keys, sorted(set(keys)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import random
+import unittest
+import network_simulator as ns
+import network_simulator.graph as g
+import network_simulator.routing as rt
+import network_simulator.topology as tp
+
+
+# repaired trees must match a fresh heap dijkstra entry for entry, equal-cost
+# ties included, after a link change and after its undo
+class RepairTest(unittest.TestCase):
+    def assertFresh(self, engine):
+        for source, tree in engine.trees.items():
+            fresh = engine.graph.shortest_path_tree(source)
+            self.assertEqual(list(tree.dist), list(fresh.dist))
+            self.assertEqual(list(tree.pred), list(fresh.pred))
+            self.assertEqual(list(tree.first), list(fresh.first))
+
+    def check(self, graph_config, seed):
+        rng = random.Random(seed)
+        engine = rt.RoutingEngine(g.Graph(graph_config))
+        engine.compute_all()
+        links = [(a, b) for a in graph_config for b in graph_config[a] if a < b]
+        for _ in range(5):
+            a, b = rng.choice(links)
+            old = engine.graph.map[a][b]
+            # a cost of 0 destroys the link, it is created again to restore it
+            engine.update_link(a, b, rng.choice([0, 2, 5, old + 1]))
+            self.assertFresh(engine)
+            if engine.graph.has_link(a, b):
+                engine.update_link(a, b, old)
+            else:
+                batch = rt.LinkBatch()
+                batch.create_link(a, b, old)
+                engine.commit(batch)
+            self.assertFresh(engine)
+
+    # changes pile up without being undone, destroyed links cut routers off
+    def test_destroyed_links(self):
+        for seed in range(30):
+            rng = random.Random(seed)
+            graph_config = tp.random_graph(15, 20, seed=seed, max_cost=1)
+            engine = rt.RoutingEngine(g.Graph(graph_config))
+            engine.compute_all()
+            links = [(a, b) for a in graph_config for b in graph_config[a] if a < b]
+            for _ in range(10):
+                a, b = rng.choice(links)
+                engine.update_link(a, b, rng.choice([0, 0, 1, 2, 3]))
+                self.assertFresh(engine)
+
+    def test_unreachable_gets_no_route(self):
+        graph_config = {0: {1: 1, 2: 5}, 1: {0: 1, 2: 1}, 2: {0: 5, 1: 1, 3: 1}, 3: {2: 1}}
+        s = ns.Simulator(graph_config, tp.plain_config(graph_config))
+        s.update_link_cost(2, 3, 0)
+        self.assertEqual(s.update_link_cost(1, 2, 3), {})
+        self.assertNotIn(3, s.routers[0].routing_table)
+        self.assertFresh(s.engine)
+
+    def test_random_graphs(self):
+        for seed in range(20):
+            self.check(tp.random_graph(30, 60, seed=seed, max_cost=1), seed)
+
+    def test_grids(self):
+        for seed in range(10):
+            self.check(tp.grid(4, 4), seed)
+
+    # a fork only repairs the trees a change can affect, ties included
+    def test_fork(self):
+        for seed in range(10):
+            graph_config = tp.random_graph(30, 60, seed=seed, max_cost=1)
+            engine = rt.RoutingEngine(g.Graph(graph_config))
+            engine.compute_all()
+            fork = engine.fork()
+            rng = random.Random(seed)
+            for a, b in rng.sample([(a, b) for a in graph_config for b in graph_config[a] if a < b], 4):
+                fork.update_link(a, b, rng.choice([2, 3]))
+                self.assertFresh(fork)
+                fork.update_link(a, b, 1)
+                self.assertFresh(fork)
+            self.assertFresh(engine)
+
+    def test_change_and_undo(self):
+        s = ns.Simulator(tp.grid(3, 3), tp.plain_config(range(9)))
+        tables = {i: dict(router.routing_table) for i, router in s.routers.items()}
+        s.update_link_cost(0, 1, 5)
+        s.update_link_cost(0, 1, 1)
+        self.assertEqual({i: router.routing_table for i, router in s.routers.items()}, tables)
+
+    def test_batch_matches_single_updates(self):
+        for seed in range(10):
+            graph_config = tp.random_graph(20, 40, seed=seed, max_cost=1)
+            single = ns.Simulator(graph_config, tp.plain_config(graph_config))
+            batched = ns.Simulator(graph_config, tp.plain_config(graph_config))
+            a = random.Random(seed).randrange(20)
+            b = next(iter(graph_config[a]))
+            single.update_link_cost(a, b, 3)
+            batched.apply_link_updates([(a, b, 3)])
+            for i in graph_config:
+                self.assertEqual(single.routers[i].routing_table, batched.routers[i].routing_table)
+
+
+if __name__ == '__main__':
+    unittest.main()